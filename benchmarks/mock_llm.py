@@ -0,0 +1,157 @@
+"""
+Local stand-in for the Azure OpenAI chat completions endpoint, for benchmarks
+without network, quota or cost. Answers every item line of an audit prompt as
+"✅ OK" and every "Artikel-Nr Preis" pair of a price list prompt as an item.
+Latency and throttling (429 with retry-after-ms) are configurable.
+
+    python -m benchmarks.mock_llm --port 8765 --latency-ms 800 --rate-429 0.1
+
+Point the app at it with AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8765.
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+ITEM_LINE = re.compile(r'^(\d{6,})\s+(.+?)\s+(\d+)\s*([A-Za-z]+)\s+([\d,.]+)\s+([\d,.]+)', re.MULTILINE)
+LS_LINE = re.compile(r'Lfsch-/Rechn-Nr\.\s*:\s*(\d+)')
+PRICE_LINE = re.compile(r'^(\d{6,})\s.*?([\d.]+,\d{2})\s*(?:EUR)?\s*$', re.MULTILINE)
+
+
+def _audit_answer(prompt: str) -> Dict[str, Any]:
+    rows = []
+    ls_nr = ""
+    for line in prompt.split("\n"):
+        ls_match = LS_LINE.search(line)
+        if ls_match:
+            ls_nr = ls_match.group(1)
+            continue
+        item = ITEM_LINE.match(line.strip())
+        if item:
+            art, name, qty, _, price, _ = item.groups()
+            rows.append(f"✅ OK;{ls_nr};{art};{name};{qty};{qty};{price};{price}")
+    return {"csv_data": "\n".join(rows)}
+
+
+def _price_answer(prompt: str) -> Dict[str, Any]:
+    items = [{"id": art, "price": float(price.replace(".", "").replace(",", "."))}
+             for art, price in PRICE_LINE.findall(prompt)]
+    return {"items": items}
+
+
+class MockLLMServer:
+    """
+    Threaded HTTP server answering POST .../chat/completions.
+    latency_s (+ uniform jitter_s) is slept per request; rate_429 is the share
+    of requests answered with 429 and a retry-after-ms header.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_s: float = 0.0,
+                 jitter_s: float = 0.0, rate_429: float = 0.0, retry_after_ms: int = 200, seed: int = 1):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.rate_429 = rate_429
+        self.retry_after_ms = retry_after_ms
+        self.requests = 0
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.split("?")[0].endswith("/chat/completions"):
+                    return self._send(404, {"error": {"message": "not found"}})
+                with mock._lock:
+                    mock.requests += 1
+                    throttle = mock._random.random() < mock.rate_429
+                    delay = mock.latency_s + mock._random.uniform(0, mock.jitter_s)
+                    mock.throttled += throttle
+                if throttle:
+                    return self._send(429, {"error": {"code": "429", "message": "Rate limit exceeded (mock)"}},
+                                      {"retry-after-ms": str(mock.retry_after_ms)})
+                time.sleep(delay)
+                self._send(200, mock.completion(body))
+
+            def _send(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        messages: List[Dict[str, str]] = body.get("messages", [])
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        prompt = "\n".join(m["content"] for m in messages if m["role"] == "user")
+        answer = _price_answer(prompt) if "data extractor" in system else _audit_answer(prompt)
+        content = json.dumps(answer, ensure_ascii=False)
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        return {
+            "id": f"mock-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                      "total_tokens": prompt_tokens + len(content) // 4},
+        }
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Lokaler OpenAI-Ersatz für Benchmarks")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=500)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Anteil der Anfragen mit 429 (0-1)")
+    args = parser.parse_args(argv)
+    server = MockLLMServer(port=args.port, latency_s=args.latency_ms / 1000, jitter_s=args.jitter_ms / 1000,
+                           rate_429=args.rate_429)
+    print(f"Mock-LLM auf {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
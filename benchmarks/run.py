@@ -0,0 +1,277 @@
+"""
+Benchmark suite: parser, reconciliation, KI audit batches (against the local
+mock LLM server), line history, end-to-end ingestion and report generation on
+synthetic Kammerer documents.
+
+    python -m benchmarks.run                  # full run
+    python -m benchmarks.run --quick          # small sizes, a few seconds
+    python -m benchmarks.run --only parse,reports --fail-on-regression
+
+Every run is appended to bench_data/results.jsonl (with commit, host and
+sizes) and compared with the previous run of the same benchmark and sizes
+on the same host. The directory is not tracked, since results are specific
+to the machine; --results selects another file, e.g. a shared baseline.
+Page and LLM caches are disabled, so every run measures the real work.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import datetime
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Isolated data dir and no caches; set before the modules read their settings
+os.environ.setdefault("AUDIT_DATA_DIR", tempfile.mkdtemp(prefix="audit-bench-"))
+os.environ["AUDIT_PAGE_CACHE_MB"] = "0"
+os.environ["AUDIT_LLM_CACHE"] = "0"
+os.environ.setdefault("AUDIT_TRACE_LOG", "0")
+
+import pandas as pd
+
+from benchmarks.synthetic import generate
+from benchmarks.mock_llm import MockLLMServer
+
+RESULTS_FILE = Path(__file__).resolve().parent.parent / "bench_data" / "results.jsonl"
+BENCHMARKS = ("parse", "reconcile", "prices", "auditor", "history", "ingest", "reports")
+
+
+def _best_of(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _result(name: str, count: float, unit: str, seconds: float, **extra) -> Dict[str, Any]:
+    return {"name": name, "value": round(count / seconds, 2) if seconds > 0 else 0.0, "unit": unit,
+            "seconds": round(seconds, 4), "n": count, **extra}
+
+
+def bench_parse(data, args) -> List[Dict[str, Any]]:
+    from modules.parser import InvoiceParser
+    pages = args.pages
+    results = []
+    for name, parser in (("parse_table_region", InvoiceParser(workers=1)),
+                         ("parse_full_page", InvoiceParser(workers=1, crop_to_table=False)),
+                         ("parse_parallel", InvoiceParser())):
+        lines = []
+        seconds = _best_of(lambda: lines.append(len(parser.parse_pdf(data.invoice))), args.repeat)
+        results.append(_result(name, pages, "pages/s", seconds, lines_ok=lines[-1] == len(data.items)))
+    return results
+
+
+def _reconcile_inputs(data, rows: int):
+    from modules.parser import InvoiceParser
+    from modules.delivery_index import DeliveryNoteIndex
+    from modules.price_catalog import load_excel_prices
+    from modules.utils import extract_text_from_pdf
+    df = InvoiceParser(workers=1).parse_pdf(data.invoice)
+    df = pd.concat([df] * -(-rows // len(df)), ignore_index=True).head(rows)
+    index = DeliveryNoteIndex.from_texts([extract_text_from_pdf(p) for p in data.delivery_notes])
+    return df, load_excel_prices(data.price_list_xlsx), index
+
+
+def bench_reconcile(data, args) -> List[Dict[str, Any]]:
+    from modules.reconcile import reconcile
+    df, prices, index = _reconcile_inputs(data, args.rows)
+    seconds = _best_of(lambda: reconcile(df, prices, index), args.repeat)
+    return [_result("reconcile", len(df), "rows/s", seconds)]
+
+
+def bench_prices(data, args) -> List[Dict[str, Any]]:
+    from openai import AzureOpenAI
+    from modules.price_catalog import load_excel_prices
+    from modules.price_extraction import extract_prices_chunked
+    from modules.utils import extract_text_from_pdf
+    excel_rows = len(load_excel_prices(data.price_list_xlsx))
+    results = [_result("price_list_excel", excel_rows, "rows/s",
+                       _best_of(lambda: load_excel_prices(data.price_list_xlsx), args.repeat))]
+    text = extract_text_from_pdf(data.price_list_pdf)
+    with MockLLMServer(latency_s=args.latency_ms / 1000) as server:
+        client = AzureOpenAI(api_key="bench", api_version="2024-08-01-preview", azure_endpoint=server.url)
+        found = []
+        seconds = _best_of(lambda: found.append(extract_prices_chunked(client, text, bypass_cache=True)), 1)
+    extraction = found[-1]
+    results.append(_result("price_list_pdf", extraction.chunk_count, "chunks/s", seconds,
+                           items=len(extraction.items), failed=len(extraction.failures),
+                           **({"error": extraction.failures[0][1]} if extraction.failures else {})))
+    return results
+
+
+def bench_auditor(data, args) -> List[Dict[str, Any]]:
+    from modules.auditor import InvoiceAuditor
+    from modules.price_catalog import load_excel_prices
+    from modules.utils import extract_pages_from_pdf, extract_text_from_pdf
+    pages = extract_pages_from_pdf(data.invoice)
+    prices = load_excel_prices(data.price_list_xlsx)
+    price_csv = "Artikel-Nr,Preis\n" + "\n".join(f"{art},{price}" for art, price in prices.items())
+    delivery_text = "\n".join(extract_text_from_pdf(p) for p in data.delivery_notes)
+    results = []
+    for name, mode, rate_429 in (("auditor_threads", "threads", 0.0), ("auditor_async", "async", 0.0),
+                                 ("auditor_async_429", "async", args.rate_429)):
+        with MockLLMServer(latency_s=args.latency_ms / 1000, jitter_s=args.latency_ms / 2000,
+                           rate_429=rate_429, retry_after_ms=100) as server:
+            auditor = InvoiceAuditor("bench", server.url, rpm=100000, tpm=100000000)
+            result = {}
+            started = time.perf_counter()
+            for batch in auditor.iter_discrepancies(pages, price_csv, delivery_text, mode=mode, bypass_cache=True,
+                                                    token_budget=args.token_budget):
+                result[batch.index] = (len(batch.rows), batch.failed)
+            seconds = time.perf_counter() - started
+        results.append(_result(name, len(result), "batches/s", seconds, latency_ms=args.latency_ms,
+                               rate_429=rate_429, requests=server.requests, throttled=server.throttled,
+                               rows=sum(rows for rows, _ in result.values()),
+                               failed=sum(failed for _, failed in result.values())))
+    return results
+
+
+def bench_history(data, args) -> List[Dict[str, Any]]:
+    from modules.history import LineHistory
+    from modules.reconcile import DUPLICATE_BILLING, reconcile
+    df, prices, index = _reconcile_inputs(data, len(data.items))
+    invoice = reconcile(df, prices, index)
+    history = LineHistory(db_name=f"bench_history_{os.getpid()}.sqlite")
+    ls_nr = invoice["Rechnung LS-Nr"].astype(str)
+    invoices = max(1, args.history_rows // len(invoice))
+    # Earlier invoices with their own LS numbers; the first one holds the lines of the checked invoice
+    started = time.perf_counter()
+    history.record_many(("Kammerer", f"bench-{i}", f"bench-{i}.pdf",
+                         invoice.assign(**{"Rechnung LS-Nr": ls_nr if i == 0 else ls_nr + f"-{i}"}))
+                        for i in range(invoices))
+    record_seconds = time.perf_counter() - started
+    checked = []
+    seconds = _best_of(lambda: checked.append(history.check(invoice, "Kammerer", "bench-new")), args.repeat)
+    duplicates = int((checked[-1]["Status"].to_numpy() & DUPLICATE_BILLING).astype(bool).sum())
+    return [_result("history_ingest", invoices * len(invoice), "rows/s", record_seconds, invoices=invoices),
+            _result("history_check", len(invoice), "rows/s", seconds, stored=invoices * len(invoice),
+                    duplicates_ok=duplicates == len(invoice))]
+
+
+def bench_ingest(data, args) -> List[Dict[str, Any]]:
+    from modules import tracing
+    from modules.pipeline import azure_client, start_audit
+    with MockLLMServer(latency_s=args.latency_ms / 1000) as server:
+        os.environ.update(AZURE_OPENAI_ENDPOINT=server.url, AZURE_OPENAI_API_KEY="bench")
+        azure_client.cache_clear()
+        with tracing.trace("bench_ingest") as run:
+            started = time.perf_counter()
+            start_audit(str(data.invoice), [str(p) for p in data.delivery_notes], [str(data.price_list_pdf)],
+                        use_stored_prices=False, log=lambda message: None)
+            seconds = time.perf_counter() - started
+        azure_client.cache_clear()
+    # Time of each input on its own: the end-to-end time should be close to the slowest, not the sum
+    inputs = [r["duration_ms"] / 1000 for r in run.records() if r["name"].startswith("ingest.")]
+    return [_result("ingest_end_to_end", 1, "audits/s", seconds, latency_ms=args.latency_ms,
+                    slowest_input_s=round(max(inputs), 3), sum_inputs_s=round(sum(inputs), 3))]
+
+
+def bench_reports(data, args) -> List[Dict[str, Any]]:
+    from modules.reconcile import reconcile
+    from modules.reports import REPORT_BUILDERS
+    df, prices, index = _reconcile_inputs(data, args.report_rows)
+    result = reconcile(df, prices, index)
+    for builder in REPORT_BUILDERS.values():
+        # One-time setup (fonts, logo) is paid once per process in the app as well
+        builder(result.head(10))
+    return [_result(f"report_{kind}", len(result), "rows/s", _best_of(lambda: builder(result), args.repeat))
+            for kind, builder in REPORT_BUILDERS.items()]
+
+
+BENCH_FUNCTIONS = {"parse": bench_parse, "reconcile": bench_reconcile, "prices": bench_prices,
+                   "auditor": bench_auditor, "history": bench_history, "ingest": bench_ingest,
+                   "reports": bench_reports}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(path: Path = RESULTS_FILE) -> List[Dict[str, Any]]:
+    if not path.exists():
+        return []
+    with path.open(encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_result(history: List[Dict[str, Any]], result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Last stored result of the same benchmark with the same sizes on the same host.
+    """
+    for old in reversed(history):
+        if old["name"] == result["name"] and old["host"] == result["host"] and old["sizes"] == result["sizes"]:
+            return old
+    return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks (synthetische Daten, Mock-LLM)")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help=f"Auswahl aus {', '.join(BENCHMARKS)}")
+    parser.add_argument("--pages", type=int, default=50, help="Seiten der synthetischen Rechnung")
+    parser.add_argument("--rows", type=int, default=200000, help="Zeilen für den Abgleich")
+    parser.add_argument("--report-rows", type=int, default=50000, help="Zeilen für die Reports")
+    parser.add_argument("--history-rows", type=int, default=1000000, help="Gespeicherte Zeilen der Positionshistorie")
+    parser.add_argument("--latency-ms", type=float, default=300, help="Antwortzeit des Mock-LLM")
+    parser.add_argument("--rate-429", type=float, default=0.2, help="429-Anteil im Drossel-Szenario")
+    parser.add_argument("--token-budget", type=int, default=3000, help="Eingabe-Token je KI-Batch")
+    parser.add_argument("--repeat", type=int, default=3, help="Wiederholungen (bester Wert zählt)")
+    parser.add_argument("--quick", action="store_true", help="Kleine Größen für einen schnellen Lauf")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Erlaubter Rückgang vor 'REGRESSION'")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--results", type=Path, default=RESULTS_FILE, help="Ergebnisdatei (Vergleich und Speichern)")
+    parser.add_argument("--no-save", action="store_true", help="Ergebnis nicht in die Ergebnisdatei schreiben")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.pages, args.rows, args.report_rows, args.latency_ms, args.repeat = 8, 20000, 5000, 50, 1
+        args.history_rows = 50000
+    selected = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = set(selected) - set(BENCH_FUNCTIONS)
+    if unknown:
+        parser.error(f"Unbekannte Benchmarks: {', '.join(sorted(unknown))}")
+
+    sizes = {"pages": args.pages, "rows": args.rows, "report_rows": args.report_rows, "history_rows": args.history_rows,
+             "latency_ms": args.latency_ms, "rate_429": args.rate_429, "token_budget": args.token_budget}
+    run = {"run_at": datetime.datetime.now().isoformat(timespec="seconds"), "commit": _git_commit(),
+           "host": socket.gethostname(), "python": platform.python_version(), "cpus": os.cpu_count(), "sizes": sizes}
+    history = load_results(args.results)
+    regressions = 0
+    with tempfile.TemporaryDirectory(prefix="audit-bench-docs-") as tmp:
+        data = generate(tmp, pages=args.pages)
+        print(f"Synthetische Rechnung: {args.pages} Seiten, {len(data.items)} Positionen")
+        new_results = []
+        for name in selected:
+            for result in BENCH_FUNCTIONS[name](data, args):
+                result = {**run, **result}
+                old = previous_result(history, result)
+                change = ""
+                if old and old["value"]:
+                    delta = result["value"] / old["value"] - 1
+                    change = f"{delta:+.1%} ggü. {old['commit'] or old['run_at']}"
+                    if delta < -args.tolerance:
+                        change += "  REGRESSION"
+                        regressions += 1
+                extra = {k: v for k, v in result.items() if k not in run and k not in ("name", "value", "unit", "seconds", "n")}
+                print(f"{result['name']:<22} {result['value']:>12,.1f} {result['unit']:<10} {change}"
+                      + (f"  {extra}" if extra else ""))
+                new_results.append(result)
+    if not args.no_save:
+        args.results.parent.mkdir(parents=True, exist_ok=True)
+        with args.results.open("a", encoding="utf-8") as f:
+            for result in new_results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Cold start and rerun budget of the Streamlit app.
+
+    python -m benchmarks.startup                       # measure and check the budget
+    python -m benchmarks.startup --cold-budget-ms 2500 --rerun-budget-ms 150
+
+Measured in a fresh interpreter (AppTest, no job workers):
+  cold start  import of streamlit plus the first run of app.py (its imports and
+              module-level work), i.e. what a cold App Service instance pays
+              before it can render a page
+  rerun       median of further runs of the same session (every widget click)
+  dashboard   median rerun with a finished audit on screen (chart, table, downloads)
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+APP = ROOT / "app.py"
+
+# Budgets in ms, for the App Service instance size (B1); override per host with the flags
+COLD_BUDGET_MS = 2000
+# app.py's own share of the cold start (imports and module-level work, without streamlit)
+FIRST_RUN_BUDGET_MS = 600
+RERUN_BUDGET_MS = 150
+DASHBOARD_BUDGET_MS = 400
+# Packages that should only be loaded by the code paths that need them
+HEAVY_MODULES = ("plotly", "openai", "dotenv", "fpdf", "openpyxl", "pdfplumber")
+
+
+def _finished_job(rows: int) -> str:
+    """
+    A finished audit job with a reconciled synthetic result of about rows lines.
+    """
+    import pandas as pd
+    from benchmarks.synthetic import generate
+    from modules.delivery_index import DeliveryNoteIndex
+    from modules.jobs import get_job_store
+    from modules.parser import InvoiceParser
+    from modules.price_catalog import load_excel_prices
+    from modules.reconcile import reconcile
+    from modules.utils import extract_text_from_pdf
+    data = generate(tempfile.mkdtemp(prefix="audit-startup-docs-"), pages=4)
+    df = InvoiceParser(workers=1).parse_pdf(data.invoice)
+    df = pd.concat([df] * -(-rows // len(df)), ignore_index=True).head(rows)
+    index = DeliveryNoteIndex.from_texts([extract_text_from_pdf(p) for p in data.delivery_notes])
+    result = reconcile(df, load_excel_prices(data.price_list_xlsx), index)
+    store = get_job_store()
+    job_id = store.create("audit", {"supplier": "Kammerer"}, {})
+    store.save_result(job_id, result)
+    store.finish(job_id)
+    return job_id
+
+
+def _median_run_ms(app_test, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        app_test.run()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def _child(reruns: int, rows: int) -> Dict[str, Any]:
+    started = time.perf_counter()
+    import streamlit  # noqa: F401
+    import_ms = (time.perf_counter() - started) * 1000
+    from streamlit.testing.v1 import AppTest
+    # The first AppTest run of a process scans installed packages for components; pay that outside the timing
+    AppTest.from_string("import streamlit as st").run()
+    preloaded = {name.split(".")[0] for name in sys.modules}
+
+    app_test = AppTest.from_file(str(APP), default_timeout=120)
+    started = time.perf_counter()
+    app_test.run()
+    first_run_ms = (time.perf_counter() - started) * 1000
+    # Heavy packages the first page view loads on top of streamlit
+    loaded = sorted(({name.split(".")[0] for name in sys.modules} - preloaded) & set(HEAVY_MODULES))
+    if app_test.exception:
+        raise RuntimeError(app_test.exception[0].value)
+    rerun_ms = _median_run_ms(app_test, reruns)
+
+    dashboard = AppTest.from_file(str(APP), default_timeout=120)
+    dashboard.query_params["job"] = _finished_job(rows)
+    dashboard.run()
+    if dashboard.exception:
+        raise RuntimeError(dashboard.exception[0].value)
+    dashboard_ms = _median_run_ms(dashboard, reruns)
+    return {"import_ms": round(import_ms, 1), "first_run_ms": round(first_run_ms, 1),
+            "cold_ms": round(import_ms + first_run_ms, 1), "rerun_ms": round(rerun_ms, 1),
+            "dashboard_rerun_ms": round(dashboard_ms, 1),
+            "modules": loaded}
+
+
+def measure(reruns: int = 10, rows: int = 2000) -> Dict[str, Any]:
+    """
+    Runs the measurement in a fresh interpreter, so imports are really cold.
+    """
+    env = dict(os.environ, AUDIT_JOB_WORKERS="0", AUDIT_TRACE_LOG="0",
+               AUDIT_DATA_DIR=tempfile.mkdtemp(prefix="audit-startup-"))
+    out = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--child", "--reruns", str(reruns),
+                          "--rows", str(rows)], cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Kaltstart- und Rerun-Budget der App")
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=2000, help="Zeilen des Prüfergebnisses im Dashboard")
+    parser.add_argument("--cold-budget-ms", type=float, default=COLD_BUDGET_MS)
+    parser.add_argument("--first-run-budget-ms", type=float, default=FIRST_RUN_BUDGET_MS)
+    parser.add_argument("--rerun-budget-ms", type=float, default=RERUN_BUDGET_MS)
+    parser.add_argument("--dashboard-budget-ms", type=float, default=DASHBOARD_BUDGET_MS)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        print(json.dumps(_child(args.reruns, args.rows)))
+        return 0
+
+    result = measure(args.reruns, args.rows)
+    over = 0
+    for label, key, budget in (("Kaltstart", "cold_ms", args.cold_budget_ms),
+                               ("Erster Lauf app.py", "first_run_ms", args.first_run_budget_ms),
+                               ("Rerun", "rerun_ms", args.rerun_budget_ms),
+                               ("Rerun Dashboard", "dashboard_rerun_ms", args.dashboard_budget_ms)):
+        ok = result[key] <= budget
+        over += not ok
+        print(f"{label:<19} {result[key]:>8.0f} ms   Budget {budget:.0f} ms   {'OK' if ok else 'ÜBERSCHRITTEN'}")
+    print(f"  Import streamlit {result['import_ms']:.0f} ms; beim ersten Lauf geladen: {', '.join(result['modules']) or '-'}")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Synthetic Kammerer-style documents for benchmarks: invoices, matching delivery
+notes and price lists (Excel and PDF) with a known share of injected errors.
+
+    python -m benchmarks.synthetic --pages 50 --out bench_data/
+"""
+import random
+import argparse
+import datetime
+import pandas as pd
+from pathlib import Path
+from fpdf import FPDF
+from typing import List, NamedTuple, Optional
+
+ARTICLES = ["Plum Sauvignon Blanc 0,75l", "Riesling trocken 1,0l", "Grauburgunder QbA 0,75l",
+            "Spätburgunder Rotwein 0,75l", "Mineralwasser still 0,7l", "Apfelsaft naturtrüb 1,0l",
+            "Pils Fass 30l", "Weizen hell 0,5l", "Cola 0,2l Glas", "Tonic Water 0,2l"]
+UNITS = ["Fla", "Kst", "Fass", "Stk"]
+
+
+def german(value: float) -> str:
+    """
+    1234.5 -> "1.234,50" (the number format of the invoices).
+    """
+    return f"{value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+class SyntheticSet(NamedTuple):
+    """
+    Items of a generated invoice (one row per line, ground truth of the audit)
+    and the paths of the generated documents.
+    """
+    items: pd.DataFrame
+    invoice: Path
+    delivery_notes: List[Path]
+    price_list_xlsx: Path
+    price_list_pdf: Path
+
+
+def make_items(pages: int, ls_per_page: int = 3, lines_per_ls: int = 10, seed: int = 1,
+               missing_rate: float = 0.02, qty_error_rate: float = 0.02, price_error_rate: float = 0.02) -> pd.DataFrame:
+    """
+    Invoice lines with their ground truth: Geliefert is the delivered quantity
+    (0 for lines missing on the delivery note), Listenpreis the price list price.
+    """
+    rng = random.Random(seed)
+    catalog = {str(rng.randint(100000, 9999999)): round(rng.uniform(1, 60), 2) for _ in range(max(200, pages * 20))}
+    arts = list(catalog)
+    rows = []
+    ls_nr = 23400000
+    for page in range(pages):
+        for _ in range(ls_per_page):
+            ls_nr += 1
+            for _ in range(lines_per_ls):
+                art = rng.choice(arts)
+                qty = rng.randint(1, 30)
+                list_price = catalog[art]
+                price = round(list_price * 1.1, 2) if rng.random() < price_error_rate else list_price
+                delivered = qty
+                roll = rng.random()
+                if roll < missing_rate:
+                    delivered = 0
+                elif roll < missing_rate + qty_error_rate:
+                    delivered = max(0, qty - rng.randint(1, qty))
+                rows.append({"Seite": page + 1, "LS-Nr": str(ls_nr), "Artikel-Nr": art,
+                             "Bezeichnung": rng.choice(ARTICLES), "Menge": qty, "Einheit": rng.choice(UNITS),
+                             "Preis": price, "Listenpreis": list_price, "Geliefert": delivered})
+    return pd.DataFrame(rows)
+
+
+def _pdf() -> FPDF:
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=False)
+    pdf.set_font("Arial", "", 9)
+    return pdf
+
+
+def write_invoice(items: pd.DataFrame, path: Path, invoice_no: str = "5007287") -> Path:
+    """
+    Invoice with letterhead, one block per delivery note and a totals footer on every page.
+    """
+    pdf = _pdf()
+    date = datetime.date(2025, 4, 1).strftime("%d.%m.%Y")
+    for page, page_items in items.groupby("Seite", sort=True):
+        pdf.add_page()
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(0, 6, "Kammerer GmbH & Co. KG - Getränkefachgroßhandel", 0, 1)
+        pdf.set_font("Arial", "", 9)
+        pdf.cell(0, 5, "Industriestr. 12 - 79100 Freiburg - Tel. 0761 123456", 0, 1)
+        pdf.cell(0, 5, f"Rechnung Nr. {invoice_no} vom {date}    Kunden-Nr. 40711    Seite {page}", 0, 1)
+        pdf.ln(4)
+        pdf.cell(0, 5, "Art-Nr   Bezeichnung                          Menge   Einzelpreis   Gesamt", 0, 1)
+        for ls_nr, block in page_items.groupby("LS-Nr", sort=False):
+            pdf.cell(0, 5, f"Lfsch-/Rechn-Nr.: {ls_nr} vom {date}", 0, 1)
+            for art, name, qty, unit, price in zip(block["Artikel-Nr"], block["Bezeichnung"], block["Menge"],
+                                                   block["Einheit"], block["Preis"]):
+                pdf.cell(0, 5, f"{art} {name} {qty} {unit} {german(price)} {german(price * qty)}", 0, 1)
+        pdf.set_y(-30)
+        pdf.cell(0, 5, f"Zwischensumme netto {german((page_items['Preis'] * page_items['Menge']).sum())} EUR", 0, 1)
+        pdf.cell(0, 5, "Bankverbindung: Sparkasse Freiburg IBAN DE00 6805 0101 0000 1234 56", 0, 1)
+    pdf.output(str(path), "F")
+    return path
+
+
+def write_delivery_notes(items: pd.DataFrame, path: Path) -> Path:
+    """
+    One delivery note per LS-Nr (one page each); lines delivered with 0 are left out.
+    """
+    pdf = _pdf()
+    for ls_nr, block in items.groupby("LS-Nr", sort=False):
+        pdf.add_page()
+        pdf.cell(0, 5, "Kammerer GmbH & Co. KG - Lieferschein", 0, 1)
+        pdf.cell(0, 5, f"Lieferschein-Nr. {ls_nr}", 0, 1)
+        pdf.ln(3)
+        delivered = block[block["Geliefert"] > 0]
+        for art, name, qty, unit in zip(delivered["Artikel-Nr"], delivered["Bezeichnung"],
+                                        delivered["Geliefert"], delivered["Einheit"]):
+            pdf.cell(0, 5, f"{art} {name} {qty} {unit}", 0, 1)
+    pdf.output(str(path), "F")
+    return path
+
+
+def _price_list(items: pd.DataFrame) -> pd.DataFrame:
+    prices = items.drop_duplicates("Artikel-Nr")[["Artikel-Nr", "Bezeichnung", "Listenpreis"]]
+    return prices.rename(columns={"Listenpreis": "Preis EUR"}).reset_index(drop=True)
+
+
+def write_price_list_excel(items: pd.DataFrame, path: Path) -> Path:
+    _price_list(items).to_excel(path, index=False)
+    return path
+
+
+def write_price_list_pdf(items: pd.DataFrame, path: Path, rows_per_page: int = 50) -> Path:
+    pdf = _pdf()
+    prices = _price_list(items)
+    for start in range(0, len(prices), rows_per_page):
+        pdf.add_page()
+        pdf.cell(0, 5, "Kammerer Preisliste 2025 (netto)", 0, 1)
+        for art, name, price in prices.iloc[start:start + rows_per_page].itertuples(index=False, name=None):
+            pdf.cell(0, 5, f"{art}  {name}  {german(price)} EUR", 0, 1)
+    pdf.output(str(path), "F")
+    return path
+
+
+def generate(out_dir, pages: int = 20, seed: int = 1, **item_options) -> SyntheticSet:
+    """
+    Writes invoice, delivery notes and both price list formats for one synthetic invoice.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    items = make_items(pages, seed=seed, **item_options)
+    prefix = f"kammerer_{pages}p"
+    return SyntheticSet(
+        items=items,
+        invoice=write_invoice(items, out_dir / f"{prefix}_rechnung.pdf"),
+        delivery_notes=[write_delivery_notes(items, out_dir / f"{prefix}_lieferscheine.pdf")],
+        price_list_xlsx=write_price_list_excel(items, out_dir / f"{prefix}_preise.xlsx"),
+        price_list_pdf=write_price_list_pdf(items, out_dir / f"{prefix}_preise.pdf"),
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Synthetische Testdokumente (Rechnung, Lieferscheine, Preislisten)")
+    parser.add_argument("--pages", type=int, default=20, help="Seiten der Rechnung")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="bench_data")
+    args = parser.parse_args(argv)
+    result = generate(args.out, args.pages, args.seed)
+    print(f"{len(result.items)} Positionen -> {result.invoice.parent}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Headless batch audit: audits every invoice PDF in a directory against the
+delivery notes and price lists, without the Streamlit UI.
+
+    python cli.py RECHNUNGEN/ --lieferscheine LIEFERSCHEINE/ --preisliste preise.xlsx --out ergebnis/
+
+Without --preisliste the stored price catalog of the supplier is used. Every
+audited invoice is checked against and recorded in the line history
+(double billing, price drift), so a batch over past invoices also fills it.
+"""
+import sys
+import argparse
+import datetime
+from dotenv import load_dotenv
+
+from modules.batch_audit import OUTPUT_FORMATS, check_output_format, find_pdfs, load_prices, run_batch
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Rechnungsprüfung im Batch (ohne Oberfläche)")
+    parser.add_argument("invoices", help="Verzeichnis mit Rechnungs-PDFs")
+    parser.add_argument("--lieferscheine", dest="delivery", help="Verzeichnis mit Lieferschein-PDFs")
+    parser.add_argument("--preisliste", dest="price_lists", nargs="*", default=[], help="Preislisten (Excel/PDF)")
+    parser.add_argument("--lieferant", dest="supplier", default="Kammerer")
+    parser.add_argument("--stichtag", dest="as_of", type=datetime.date.fromisoformat, default=None,
+                        help="Gespeicherte Preise gültig am (YYYY-MM-DD, Standard: heute)")
+    parser.add_argument("--gueltig-ab", dest="valid_from", type=datetime.date.fromisoformat, default=None,
+                        help="Gültig-ab-Datum der Preislisten (Standard: heute für neue, bekannte behalten ihr Datum)")
+    parser.add_argument("--out", default="audit_output", help="Ausgabeverzeichnis")
+    parser.add_argument("--format", dest="output_format", choices=OUTPUT_FORMATS, default="csv")
+    parser.add_argument("--workers", type=int, default=None, help="Prozesse (Standard: alle Kerne)")
+    args = parser.parse_args(argv)
+    try:
+        check_output_format(args.output_format)
+    except ValueError as e:
+        parser.error(str(e))
+
+    load_dotenv()
+    invoices = find_pdfs(args.invoices)
+    if not invoices:
+        print(f"Keine Rechnungen in {args.invoices} gefunden.", file=sys.stderr)
+        return 1
+
+    price_db = load_prices(args.price_lists, args.supplier, args.as_of, args.valid_from)
+    print(f"{len(price_db)} Preise geladen ({args.supplier})")
+    summary = run_batch(invoices, price_db, find_pdfs(args.delivery), args.out, args.output_format, args.workers,
+                        supplier=args.supplier)
+    return 1 if (summary["Fehler"] != "").any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,72 @@
 import os
 import json
+import time
+import logging
+import queue
+import asyncio
+import threading
 import concurrent.futures
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI, RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+import numpy as np
 import pandas as pd
-from typing import Dict, Any, List, Optional, Callable
+from typing import Dict, Any, Iterator, List, NamedTuple, Optional, Callable, Tuple
+from modules import tracing
+from modules.llm_cache import cached_chat_completion, get_llm_cache, CACHE_ENABLED as LLM_CACHE_ENABLED
+from modules.rate_limit import RateLimiter, estimate_tokens, backoff_delay
+from modules.prompt_context import PromptBatch, PromptContextBuilder, DEFAULT_INPUT_TOKEN_BUDGET
+from modules.reconcile import (reconcile, resolved_mask, flags_from_audit_label, status_to_labels, parse_german_number,
+                               LS_MISSING, NO_DELIVERY, NOT_ON_NOTE, QTY_ERROR, PRICE_ERROR)
+
+CSV_HEADER = "Handlung;Rechnung LS-Nr;Artikel-Nr;Bezeichnung;Menge Rech;Menge Geliefert;Preis Rech;Preis Soll"
+MAX_COMPLETION_TOKENS = 16000
+MAX_RETRIES = 6
+# Unresolved lines per pseudo-page handed to the batch planner in hybrid mode
+HYBRID_LINES_PER_PAGE = 40
+
+# Quotas of the Azure deployment (Azure portal -> Deployments -> Rate limit)
+DEFAULT_RPM = float(os.getenv("AZURE_OPENAI_RPM", "300"))
+DEFAULT_TPM = float(os.getenv("AZURE_OPENAI_TPM", "300000"))
+API_VERSION = "2024-12-01-preview"
+
+logger = logging.getLogger("audit.llm")
+
+class BatchResult(NamedTuple):
+    """
+    CSV rows of one finished batch (see InvoiceAuditor.iter_discrepancies) and
+    the pages it covered (pages[first_page:first_page + page_count]).
+    """
+    index: int
+    total: int
+    rows: List[str]
+    failed: bool = False
+    first_page: int = 0
+    page_count: int = 0
+
 
 class InvoiceAuditor:
-    def __init__(self, api_key: str, endpoint: str):
-        self.client = AzureOpenAI(
+    def __init__(self, api_key: str, endpoint: str, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 client: Optional[AzureOpenAI] = None):
+        # A shared client (see pipeline.azure_client) keeps its connections across audits.
+        # Retries are handled by _process_batch (jittered backoff, counted on the span), so
+        # the SDK's own retries are switched off; the copy shares the connection pool.
+        self.client = (client or AzureOpenAI(
             api_key=api_key,
-            api_version="2024-12-01-preview",
+            api_version=API_VERSION,
             azure_endpoint=endpoint
-        )
+        )).with_options(max_retries=0)
         self.model = "gpt-5.2-"  # Deployment name in Azure
+        self.api_key = api_key
+        self.endpoint = endpoint
+        self.async_client: Optional[AsyncAzureOpenAI] = None
+        self.rpm = rpm or DEFAULT_RPM
+        self.tpm = tpm or DEFAULT_TPM
 
-    def _process_batch(self, chunk_pages: List[str], batch_index: int, total_batches: int, 
-                      price_list_csv: str, delivery_note_text: str, custom_instructions: str, deployment_name: str) -> List[str]:
+    def _build_messages(self, chunk_pages: List[str], batch_index: int, price_list_csv: str,
+                        delivery_note_text: str, custom_instructions: str) -> List[Dict[str, str]]:
         """
-        Helper function to process a single batch of pages.
-        Returns a list of CSV rows found in this batch.
+        Builds the chat messages for one batch of pages.
         """
         chunk_text = "\n--- PAGE BREAK ---\n".join(chunk_pages)
-        # print(f"Processing Batch {batch_index + 1} / {total_batches} (Parallel)...") # Moved to callback
         
         system_prompt = """
         You are an expert Financial Auditor AI. Your task is to audit a PART of an invoice against a price list and delivery notes.
@@ -76,33 +121,66 @@ class InvoiceAuditor:
         Analyze this chunk. Return JSON with 'csv_data' containing lines for this chunk.
         """
 
-        try:
-            # Note: AzureOpenAI client is thread-safe
-            response = self.client.chat.completions.create(
-                model=deployment_name,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
-                response_format={"type": "json_object"},
-                max_completion_tokens=16000
-            )
-            
-            content = response.choices[0].message.content
-            start = content.find('{')
-            end = content.rfind('}') + 1
-            if start != -1 and end != -1:
-                batch_json = json.loads(content[start:end])
-                batch_csv = batch_json.get("csv_data", "")
-                if batch_csv:
-                    rows = batch_csv.strip().split('\n')
-                    # Filter out headers if AI decided to include them despite instructions
-                    rows = [r for r in rows if "Handlung" not in r and r.strip()]
-                    return rows
-        except Exception as e:
-            print(f"Error in batch {batch_index}: {e}")
-        
-        return []
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+
+    def _process_batch(self, chunk_pages: List[str], batch_index: int, total_batches: int, 
+                      price_list_csv: str, delivery_note_text: str, custom_instructions: str, deployment_name: str,
+                      bypass_cache: bool = False) -> List[str]:
+        """
+        Helper function to process a single batch of pages.
+        Returns a list of CSV rows found in this batch. Throttled and transient
+        failures are retried with jittered backoff (like _process_batch_async);
+        the last error is raised once MAX_RETRIES is exhausted, so the batch is
+        reported as failed instead of silently returning no rows.
+        """
+        messages = self._build_messages(chunk_pages, batch_index, price_list_csv, delivery_note_text, custom_instructions)
+        with tracing.span("llm.batch", batch=batch_index + 1, pages=len(chunk_pages)):
+            for attempt in range(MAX_RETRIES + 1):
+                retry_after = None
+                if attempt:
+                    tracing.count(retries=1)
+                try:
+                    # Note: AzureOpenAI client is thread-safe
+                    return cached_chat_completion(
+                        self.client,
+                        model=deployment_name,
+                        messages=messages,
+                        parse=self._parse_batch_content,
+                        bypass=bypass_cache,
+                        response_format={"type": "json_object"},
+                        max_completion_tokens=MAX_COMPLETION_TOKENS
+                    )
+                except RateLimitError as e:
+                    tracing.count(throttled=1)
+                    retry_after = _retry_after_seconds(e)
+                    error = e
+                except (APITimeoutError, APIConnectionError, InternalServerError, ValueError) as e:
+                    # ValueError: malformed answer, ask again
+                    error = e
+                if attempt < MAX_RETRIES:
+                    time.sleep(backoff_delay(attempt, retry_after=retry_after))
+            raise error
+
+    @staticmethod
+    def _parse_batch_content(content: str) -> List[str]:
+        """
+        Extracts the CSV rows from the model's JSON answer.
+        Raises if the answer contains no JSON object (so it is not cached).
+        """
+        start = content.find('{')
+        end = content.rfind('}') + 1
+        if start == -1 or end == 0:
+            raise ValueError("No JSON object in response")
+        batch_json = json.loads(content[start:end])
+        batch_csv = batch_json.get("csv_data", "")
+        if not batch_csv:
+            return []
+        rows = batch_csv.strip().split('\n')
+        # Filter out headers if AI decided to include them despite instructions
+        return [r for r in rows if "Handlung" not in r and r.strip()]
 
     def analyze_discrepancies(self,
                             invoice_data: Any,
@@ -110,76 +188,152 @@ class InvoiceAuditor:
                             delivery_note_text: str = "",
                             custom_instructions: str = "",
                             deployment_name: str = "gpt-5.2-",
-                            progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+                            progress_callback: Optional[Callable[[int, int], None]] = None,
+                            bypass_cache: bool = False,
+                            mode: str = "threads",
+                            prune_context: bool = True,
+                            token_budget: int = DEFAULT_INPUT_TOKEN_BUDGET) -> Dict[str, Any]:
         """
         Sends the data to Azure OpenAI (GPT-5.2) to identify discrepancies.
         Supports Batch Processing for large invoices.
+        Identical batch prompts are answered from the LLM response cache unless bypass_cache is set.
+        mode="async" runs the batches with the rate-limited async client (see analyze_discrepancies_async).
+        With prune_context each batch only carries the price rows and delivery notes
+        relevant to its pages, and batches are sized to token_budget (see PromptContextBuilder).
         """
-        
-        # Ensure invoice_data is a list of pages
-        if isinstance(invoice_data, str):
-            # Fallback if string passed: treat as single chunk
-            pages = [invoice_data]
-        else:
-            pages = invoice_data
+        pages = [invoice_data] if isinstance(invoice_data, str) else invoice_data
+        all_csv_rows: List[str] = []
+        failed_batches: List[int] = []
+        total_batches = 0
+        for batch in self.iter_discrepancies(pages, price_list_csv, delivery_note_text, custom_instructions,
+                                             deployment_name, progress_callback, bypass_cache, mode,
+                                             prune_context, token_budget):
+            total_batches = batch.total
+            all_csv_rows.extend(batch.rows)
+            if batch.failed:
+                failed_batches.append(batch.index)
+        return self._build_result(pages, total_batches, all_csv_rows, failed_batches)
 
-        # CHUNK CONFIGURATION
-        CHUNK_SIZE = 2  # Pages per batch (Reduced to prevent truncation)
-        all_csv_rows = []
-        
-        # Create batches
-        batches = [pages[i:i + CHUNK_SIZE] for i in range(0, len(pages), CHUNK_SIZE)]
+    def iter_discrepancies(self,
+                           invoice_data: Any,
+                           price_list_csv: str,
+                           delivery_note_text: str = "",
+                           custom_instructions: str = "",
+                           deployment_name: str = "gpt-5.2-",
+                           progress_callback: Optional[Callable[[int, int], None]] = None,
+                           bypass_cache: bool = False,
+                           mode: str = "threads",
+                           prune_context: bool = True,
+                           token_budget: int = DEFAULT_INPUT_TOKEN_BUDGET) -> Iterator[BatchResult]:
+        """
+        Streaming variant of analyze_discrepancies (same parameters): yields one
+        BatchResult per batch as soon as that batch and all batches before it are
+        done. Batches finishing early are buffered, so rows arrive in invoice order.
+        progress_callback still fires on every completion, in completion order.
+        """
+        pages = [invoice_data] if isinstance(invoice_data, str) else invoice_data
+        batches = self._plan_batches(pages, price_list_csv, delivery_note_text, prune_context, token_budget)
         total_batches = len(batches)
-        
-        # 1. PARALLEL BATCH PROCESSING
-        # We use a ThreadPoolExecutor to run multiple API calls in parallel
-        # Max workers = 5 to balance speed and rate limits
+        first_pages = np.cumsum([0] + [len(batch.pages) for batch in batches]).tolist()
+        if mode == "async":
+            completions = self._completed_async(batches, custom_instructions, deployment_name, bypass_cache)
+        else:
+            completions = self._completed_threads(batches, custom_instructions, deployment_name, bypass_cache)
+
+        buffered: Dict[int, BatchResult] = {}
+        next_index = 0
         completed_count = 0
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            # Map batches to future objects
+        for batch_idx, rows, failed in completions:
+            completed_count += 1
+            if progress_callback:
+                progress_callback(completed_count, total_batches)
+            buffered[batch_idx] = BatchResult(batch_idx, total_batches, rows, failed,
+                                              first_pages[batch_idx], len(batches[batch_idx].pages))
+            while next_index in buffered:
+                yield buffered.pop(next_index)
+                next_index += 1
+
+    def _completed_threads(self, batches: List[PromptBatch], custom_instructions: str, deployment_name: str,
+                           bypass_cache: bool) -> Iterator[Tuple[int, List[str], bool]]:
+        """
+        Runs the batches on a thread pool and yields (index, rows, failed) in completion order.
+        """
+        # Max workers = 5 to balance speed and rate limits
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=5)
+        try:
             future_to_batch = {
                 executor.submit(
-                    self._process_batch, 
-                    batch, 
-                    idx, 
-                    total_batches, 
-                    price_list_csv, 
-                    delivery_note_text, 
-                    custom_instructions, 
-                    deployment_name
-                ): idx 
+                    tracing.bind(self._process_batch),
+                    batch.pages,
+                    idx,
+                    len(batches),
+                    batch.price_list_csv,
+                    batch.delivery_note_text,
+                    custom_instructions,
+                    deployment_name,
+                    bypass_cache
+                ): idx
                 for idx, batch in enumerate(batches)
             }
-            
-            # Collect results as they complete, but store in a dict to reorder later
-            results_map = {}
             for future in concurrent.futures.as_completed(future_to_batch):
                 batch_idx = future_to_batch[future]
-                completed_count += 1
-                
-                # Report Progress
-                if progress_callback:
-                    progress_callback(completed_count, total_batches)
-                
                 try:
-                    rows = future.result()
-                    results_map[batch_idx] = rows
+                    yield batch_idx, future.result(), False
                 except Exception as exc:
-                    print(f'Batch {batch_idx} generated an exception: {exc}')
-                    results_map[batch_idx] = []
+                    # The error itself is on the batch's llm.batch span
+                    logger.warning("Batch %d failed after retries: %s", batch_idx + 1, exc)
+                    tracing.count(failed_batches=1)
+                    yield batch_idx, [], True
+        finally:
+            # A consumer that stops early does not wait for (or pay for) the remaining batches
+            executor.shutdown(wait=False, cancel_futures=True)
 
-        # 2. AGGREGATION (In correct order)
-        for i in range(total_batches):
-            if i in results_map:
-                all_csv_rows.extend(results_map[i])
-        
-        full_csv_str = "Handlung;Rechnung LS-Nr;Artikel-Nr;Bezeichnung;Menge Rech;Menge Geliefert;Preis Rech;Preis Soll\n" + "\n".join(all_csv_rows)
+    def _completed_async(self, batches: List[PromptBatch], custom_instructions: str, deployment_name: str,
+                         bypass_cache: bool) -> Iterator[Tuple[int, List[str], bool]]:
+        """
+        Runs the batches with the async client on a background event loop and
+        yields (index, rows, failed) in completion order.
+        """
+        completions: "queue.Queue[Optional[Tuple[int, List[str], bool]]]" = queue.Queue()
+
+        def run_loop() -> None:
+            try:
+                asyncio.run(self._run_batches_async(batches, custom_instructions, deployment_name, bypass_cache,
+                                                    lambda idx, rows, failed: completions.put((idx, rows, failed))))
+            finally:
+                completions.put(None)
+
+        threading.Thread(target=tracing.bind(run_loop), daemon=True).start()
+        while True:
+            item = completions.get()
+            if item is None:
+                return
+            yield item
+
+    def _plan_batches(self, pages: List[str], price_list_csv: str, delivery_note_text: str,
+                      prune_context: bool, token_budget: int) -> List[PromptBatch]:
+        if not prune_context:
+            # Legacy layout: fixed 2 pages per batch, full price list and delivery notes in every call
+            CHUNK_SIZE = 2  # Pages per batch (Reduced to prevent truncation)
+            return [PromptBatch(pages[i:i + CHUNK_SIZE], price_list_csv, delivery_note_text, 0)
+                    for i in range(0, len(pages), CHUNK_SIZE)]
+        builder = PromptContextBuilder(price_list_csv, delivery_note_text)
+        return builder.plan(pages, token_budget=token_budget, max_output_tokens=MAX_COMPLETION_TOKENS)
+
+    def _build_result(self, pages: List[str], total_batches: int, all_csv_rows: List[str],
+                      failed_batches: Optional[List[int]] = None) -> Dict[str, Any]:
+        full_csv_str = CSV_HEADER + "\n" + "\n".join(all_csv_rows)
         
         # 3. FINAL SUMMARY GENERATION
+        detailed_reasoning = f"Processed {len(pages)} pages in {total_batches} parallel batches. Found {len(all_csv_rows)} line items."
+        if failed_batches:
+            detailed_reasoning += f" Batches failed after retries: {', '.join(str(i + 1) for i in failed_batches)}."
         result = {
             "summary": "Parallel Batch Analysis Complete. Please check the Dashboard for full details.",
-            "detailed_reasoning": f"Processed {len(pages)} pages in {total_batches} parallel batches. Found {len(all_csv_rows)} line items.",
+            "detailed_reasoning": detailed_reasoning,
             "csv_data": full_csv_str,
+            "failed_batches": failed_batches or [],
+            "batch_count": total_batches,
             "dashboard": [
                  {"category": "GESAMT POSITIONEN", "count": len(all_csv_rows), "description": "Alle geprüften Zeilen"},
                  {"category": "ABWEICHUNGEN", "count": sum(1 for r in all_csv_rows if "OK" not in r), "description": "Alle Fehlerarten"},
@@ -188,3 +342,310 @@ class InvoiceAuditor:
         }
         
         return result
+
+    # --- HYBRID MODE ---
+
+    def analyze_hybrid(self,
+                       df_invoice: pd.DataFrame,
+                       price_db: Optional[pd.Series] = None,
+                       delivery_index=None,
+                       price_list_csv: Optional[str] = None,
+                       delivery_note_text: str = "",
+                       custom_instructions: str = "",
+                       deployment_name: str = "gpt-5.2-",
+                       progress_callback: Optional[Callable[[int, int], None]] = None,
+                       bypass_cache: bool = False,
+                       mode: str = "threads",
+                       token_budget: int = DEFAULT_INPUT_TOKEN_BUDGET,
+                       on_update: Optional[Callable[[pd.DataFrame], None]] = None) -> Dict[str, Any]:
+        """
+        Deterministic-first audit of parsed invoice lines (InvoiceParser.parse_pdf).
+        The rule engine (reconcile) settles every line that is clearly OK or clearly
+        wrong; only unparsed or ambiguous lines (see resolved_mask) are sent to the LLM,
+        grouped under their LS-Nr. Returns the same keys as analyze_discrepancies plus
+        "lines": the reconciled DataFrame with the final Status/Handlung and a "Quelle"
+        column ("Regel", "KI", "Offen" if the LLM gave no answer for the line, or
+        "Ungeprüft" if its batch failed after retries; those lines keep the rule
+        verdict), and "unchecked": the number of "Ungeprüft" lines.
+        on_update(lines) is called once the rules have run and again after every LLM
+        batch, so a caller can show the rule verdicts immediately and refine them live.
+        """
+        with tracing.span("reconcile", lines=len(df_invoice)):
+            df = reconcile(df_invoice, price_db, delivery_index)
+        if df.empty:
+            df["Quelle"] = pd.Series(dtype=object)
+            result = self._build_result([], 0, [])
+            result["lines"] = df
+            result["unchecked"] = 0
+            return result
+
+        resolved = resolved_mask(df, price_db is not None and len(price_db) > 0, delivery_index is not None)
+        df["Quelle"] = np.where(resolved, "Regel", "Offen")
+        rows = {idx: self._rule_row(line) for idx, line in df[resolved].iterrows()}
+        if on_update:
+            on_update(df)
+
+        pages: List[str] = []
+        failed_batches: List[int] = []
+        total_batches = 0
+        unresolved = df[~resolved]
+        if len(unresolved):
+            pages, page_lines = self._unresolved_pages(unresolved)
+            if price_list_csv is None:
+                price_list_csv = "Artikel-Nr,Preis\n" + "\n".join(f"{art},{price}" for art, price in (price_db.items() if price_db is not None else ()))
+            matched: Dict[Any, str] = {}
+            with tracing.span("llm.review", lines=len(unresolved), pages=len(pages)):
+                for batch in self.iter_discrepancies(pages, price_list_csv, delivery_note_text, custom_instructions,
+                                                     deployment_name, progress_callback, bypass_cache, mode,
+                                                     prune_context=True, token_budget=token_budget):
+                    total_batches = batch.total
+                    if batch.failed:
+                        failed_batches.append(batch.index)
+                        for page_index in range(batch.first_page, batch.first_page + batch.page_count):
+                            for idx in page_lines[page_index]:
+                                if idx not in matched:
+                                    df.at[idx, "Quelle"] = "Ungeprüft"
+                    self._apply_llm_rows(df, unresolved.index, batch.rows, matched)
+                    if on_update:
+                        df["Handlung"] = status_to_labels(df["Status"])
+                        on_update(df)
+            rows.update(matched)
+
+        df["Handlung"] = status_to_labels(df["Status"])
+        all_csv_rows = [rows[idx] for idx in df.index if idx in rows]
+        result = self._build_result(pages, total_batches, all_csv_rows, failed_batches)
+        by_source = df["Quelle"].value_counts()
+        result["detailed_reasoning"] = (
+            f"{len(df)} Positionen: {by_source.get('Regel', 0)} per Regelwerk entschieden, "
+            f"{by_source.get('KI', 0)} von der KI geprüft, {by_source.get('Offen', 0)} offen."
+            + (f" Fehlgeschlagene KI-Batches: {', '.join(str(i + 1) for i in failed_batches)} "
+               f"({by_source.get('Ungeprüft', 0)} Positionen ungeprüft)." if failed_batches else "")
+        )
+        result["lines"] = df
+        result["unchecked"] = int(by_source.get("Ungeprüft", 0))
+        return result
+
+    @staticmethod
+    def _unresolved_pages(unresolved: pd.DataFrame) -> Tuple[List[str], List[List[Any]]]:
+        """
+        Invoice text for the LLM containing only the unresolved lines, each block
+        under its LS header so the model sees which delivery note a line belongs to.
+        Returns the pages and, per page, the index labels of the lines on it.
+        """
+        pages: List[str] = []
+        page_lines: List[List[Any]] = []
+        current: List[str] = []
+        current_lines: List[Any] = []
+        ls_column = unresolved["Rechnung LS-Nr"].fillna("UNKNOWN").astype(str)
+        for ls_nr, group in unresolved.groupby(ls_column, sort=False):
+            if "Original_Zeile" in group:
+                lines = group["Original_Zeile"].tolist()
+            else:
+                lines = (group["Artikel-Nr"].astype(str) + " " + group["Bezeichnung"].astype(str) + " " + group["Menge"].astype(str)
+                         + " " + group["Einheit"].astype(str) + " " + group["Preis_Einzel"].astype(str) + " " + group["Preis_Gesamt"].astype(str)).tolist()
+            for start in range(0, len(lines), HYBRID_LINES_PER_PAGE):
+                block = [f"Lfsch-/Rechn-Nr.: {ls_nr}"] + lines[start:start + HYBRID_LINES_PER_PAGE]
+                if current and len(current) + len(block) > HYBRID_LINES_PER_PAGE + 1:
+                    pages.append("\n".join(current))
+                    page_lines.append(current_lines)
+                    current, current_lines = [], []
+                current.extend(block)
+                current_lines.extend(group.index[start:start + HYBRID_LINES_PER_PAGE])
+        if current:
+            pages.append("\n".join(current))
+            page_lines.append(current_lines)
+        return pages, page_lines
+
+    @staticmethod
+    def _rule_row(line: pd.Series) -> str:
+        """
+        CSV row (CSV_HEADER layout) for a line settled by the rule engine.
+        """
+        status = int(line["Status"])
+        labels = []
+        if status & (NO_DELIVERY | NOT_ON_NOTE):
+            labels.append("❌ NICHT GELIEFERT")
+        if status & QTY_ERROR:
+            labels.append("❌ MENGENFEHLER")
+        if status & PRICE_ERROR:
+            labels.append("❌ PREISFEHLER")
+        qty = parse_german_number(pd.Series([line.get("Menge", 0)]), thousands=False).iloc[0]
+        delivered = line.get("Menge Geliefert", np.nan)
+        list_price = line.get("Listenpreis", np.nan)
+        return ";".join([
+            " | ".join(labels) or "✅ OK",
+            str(line.get("Rechnung LS-Nr", "")),
+            str(line.get("Artikel-Nr", "")),
+            str(line.get("Bezeichnung", "")).replace(";", ","),
+            f"{qty:g}",
+            "" if pd.isna(delivered) else f"{delivered:g}",
+            f"{line['Einzelpreis (Inv)']:.2f}",
+            "" if pd.isna(list_price) else f"{list_price:.2f}",
+        ])
+
+    @staticmethod
+    def _apply_llm_rows(df: pd.DataFrame, unresolved_index: pd.Index, llm_rows: List[str],
+                        matched: Dict[Any, str]) -> None:
+        """
+        Matches the LLM's CSV rows back to the unresolved lines by (LS-Nr, Artikel-Nr),
+        in order, and takes over its verdict into Status. A missing LS-Nr stays flagged.
+        Lines already answered (keys of matched) are skipped; new matches are added to it.
+        """
+        pending: Dict[tuple, List[Any]] = {}
+        for idx in unresolved_index:
+            key = (str(df.at[idx, "Rechnung LS-Nr"]), str(df.at[idx, "Artikel-Nr"]))
+            pending.setdefault(key, []).append(idx)
+        by_article: Dict[str, List[Any]] = {}
+        for (_, art_nr), indices in pending.items():
+            by_article.setdefault(art_nr, []).extend(indices)
+
+        for row in llm_rows:
+            fields = [f.strip() for f in row.split(";")]
+            if len(fields) < 3:
+                continue
+            candidates = pending.get((fields[1], fields[2])) or by_article.get(fields[2], [])
+            idx = next((i for i in candidates if i not in matched), None)
+            if idx is None:
+                continue
+            matched[idx] = row
+            df.at[idx, "Status"] = (int(df.at[idx, "Status"]) & LS_MISSING) | flags_from_audit_label(fields[0])
+            df.at[idx, "Quelle"] = "KI"
+
+    # --- ASYNC MODE ---
+
+    def _get_async_client(self) -> AsyncAzureOpenAI:
+        if self.async_client is None:
+            self.async_client = AsyncAzureOpenAI(
+                api_key=self.api_key,
+                api_version=API_VERSION,
+                azure_endpoint=self.endpoint,
+                max_retries=0  # Retries are handled by _process_batch_async
+            )
+        return self.async_client
+
+    async def _process_batch_async(self, messages: List[Dict[str, str]], batch_index: int,
+                                   deployment_name: str, limiter: RateLimiter, bypass_cache: bool = False) -> List[str]:
+        """
+        Async counterpart of _process_batch: waits for RPM/TPM budget and a concurrency
+        slot, retries throttled and transient failures with jittered backoff and
+        raises once MAX_RETRIES is exhausted (instead of silently returning no rows).
+        """
+        with tracing.span("llm.batch", batch=batch_index + 1, mode="async"):
+            return await self._request_batch_async(messages, deployment_name, limiter, bypass_cache)
+
+    async def _request_batch_async(self, messages: List[Dict[str, str]], deployment_name: str,
+                                   limiter: RateLimiter, bypass_cache: bool) -> List[str]:
+        params = {"response_format": {"type": "json_object"}, "max_completion_tokens": MAX_COMPLETION_TOKENS}
+        cache = get_llm_cache()
+        key = cache.make_key(deployment_name, messages, params)
+        if LLM_CACHE_ENABLED and not bypass_cache:
+            cached = cache.get(key)
+            if cached is not None:
+                tracing.count(llm_cache_hits=1)
+                return self._parse_batch_content(cached)
+
+        # Azure counts max_completion_tokens against the TPM quota when admitting a request
+        estimated = sum(estimate_tokens(m["content"]) for m in messages) + MAX_COMPLETION_TOKENS
+        client = self._get_async_client()
+        for attempt in range(MAX_RETRIES + 1):
+            retry_after = None
+            if attempt:
+                tracing.count(retries=1)
+            async with limiter.concurrency:
+                await limiter.acquire(estimated)
+                try:
+                    response = await client.chat.completions.create(model=deployment_name, messages=messages, **params)
+                except RateLimitError as e:
+                    tracing.count(throttled=1)
+                    limiter.on_throttle()
+                    retry_after = _retry_after_seconds(e)
+                    error = e
+                except (APITimeoutError, APIConnectionError, InternalServerError) as e:
+                    error = e
+                else:
+                    limiter.concurrency.on_success()
+                    tracing.count_usage(response)
+                    content = response.choices[0].message.content
+                    try:
+                        rows = self._parse_batch_content(content)
+                    except ValueError as e:
+                        # Malformed answer: ask again
+                        error = e
+                    else:
+                        cache.put(key, deployment_name, content)
+                        return rows
+            if attempt < MAX_RETRIES:
+                await asyncio.sleep(backoff_delay(attempt, retry_after=retry_after))
+        raise error
+
+    async def analyze_discrepancies_async(self,
+                                          invoice_data: Any,
+                                          price_list_csv: str,
+                                          delivery_note_text: str = "",
+                                          custom_instructions: str = "",
+                                          deployment_name: str = "gpt-5.2-",
+                                          progress_callback: Optional[Callable[[int, int], None]] = None,
+                                          bypass_cache: bool = False,
+                                          prune_context: bool = True,
+                                          token_budget: int = DEFAULT_INPUT_TOKEN_BUDGET) -> Dict[str, Any]:
+        """
+        Same result as analyze_discrepancies, executed with the async client.
+        Concurrency adapts to throttling (AIMD) within the deployment's RPM/TPM quota,
+        so large invoices use the full quota without dropping batches on 429s.
+        """
+        pages = [invoice_data] if isinstance(invoice_data, str) else invoice_data
+        batches = self._plan_batches(pages, price_list_csv, delivery_note_text, prune_context, token_budget)
+        total_batches = len(batches)
+
+        completed_count = 0
+        results_map: Dict[int, List[str]] = {}
+        failed_batches: List[int] = []
+
+        def on_done(idx: int, rows: List[str], failed: bool) -> None:
+            nonlocal completed_count
+            results_map[idx] = rows
+            if failed:
+                failed_batches.append(idx)
+            completed_count += 1
+            if progress_callback:
+                progress_callback(completed_count, total_batches)
+
+        await self._run_batches_async(batches, custom_instructions, deployment_name, bypass_cache, on_done)
+
+        all_csv_rows = []
+        for i in range(total_batches):
+            all_csv_rows.extend(results_map.get(i, []))
+        return self._build_result(pages, total_batches, all_csv_rows, sorted(failed_batches))
+
+    async def _run_batches_async(self, batches: List[PromptBatch], custom_instructions: str, deployment_name: str,
+                                 bypass_cache: bool, on_done: Callable[[int, List[str], bool], None]) -> None:
+        """
+        Runs all batches concurrently under one rate limiter; on_done(index, rows, failed)
+        is called as each batch finishes.
+        """
+        limiter = RateLimiter(rpm=self.rpm, tpm=self.tpm)
+
+        async def run(idx: int, batch: PromptBatch) -> None:
+            messages = self._build_messages(batch.pages, idx, batch.price_list_csv, batch.delivery_note_text, custom_instructions)
+            try:
+                rows = await self._process_batch_async(messages, idx, deployment_name, limiter, bypass_cache)
+            except Exception as exc:
+                logger.warning("Batch %d failed after retries: %s", idx + 1, exc)
+                tracing.count(failed_batches=1)
+                on_done(idx, [], True)
+            else:
+                on_done(idx, rows, False)
+
+        await asyncio.gather(*(run(idx, batch) for idx, batch in enumerate(batches)))
+
+
+def _retry_after_seconds(error: RateLimitError) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
@@ -0,0 +1,170 @@
+import os
+import time
+import logging
+import importlib.util
+import datetime
+import concurrent.futures
+import pandas as pd
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from modules.parser import InvoiceParser
+from modules.delivery_index import DeliveryNoteIndex
+from modules.reconcile import reconcile, status_counts
+from modules.history import get_line_history
+from modules.storage import content_hash
+from modules.utils import extract_page_texts
+from modules import tracing
+
+OUTPUT_FORMATS = ("csv", "parquet")
+# Parquet needs one of pandas' optional engines
+PARQUET_ENGINES = ("pyarrow", "fastparquet")
+
+# Set once per worker process by _init_worker (price list and delivery notes are
+# loaded in the parent and shipped to each worker a single time, not per invoice).
+_worker_state: Dict[str, Any] = {}
+
+logger = logging.getLogger("audit.batch")
+
+
+def find_pdfs(directory: Optional[os.PathLike]) -> List[Path]:
+    if not directory:
+        return []
+    return sorted(p for p in Path(directory).rglob("*") if p.suffix.lower() == ".pdf")
+
+
+def check_output_format(output_format: str) -> None:
+    """
+    Raises ValueError for an unknown format or a format whose writer is not installed.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unbekanntes Ausgabeformat: {output_format}")
+    if output_format == "parquet" and not any(importlib.util.find_spec(engine) for engine in PARQUET_ENGINES):
+        raise ValueError("Parquet-Ausgabe benötigt pyarrow (pip install pyarrow) oder fastparquet; "
+                         "alternativ --format csv verwenden.")
+
+
+def load_prices(price_files: Sequence[os.PathLike], supplier: str,
+                as_of: Optional[datetime.date] = None, valid_from: Optional[datetime.date] = None,
+                log=print) -> pd.Series:
+    """
+    Price lookup for the batch: the given price lists are compiled into the
+    catalog (Excel directly, PDF through the LLM extraction); without files the
+    stored catalog of the supplier is used as of the given date. A list that
+    cannot be read is logged and skipped.
+    """
+    from modules.price_catalog import get_price_catalog, load_excel_prices
+    from modules.price_extraction import IncompleteExtraction
+    from modules.pipeline import ai_extract_prices
+    catalog = get_price_catalog()
+    if not price_files:
+        return catalog.prices_as_of(supplier, as_of)
+
+    list_ids, partial_prices = [], []
+    for path in map(Path, price_files):
+        extract = load_excel_prices if path.suffix.lower() == ".xlsx" else ai_extract_prices
+        try:
+            list_ids.append(catalog.compile(str(path), supplier, valid_from, extract, name=path.name))
+        except IncompleteExtraction as e:
+            # Same as in the app: use the partial list for this run, do not store it
+            log(f"Preisliste {path.name} unvollständig gelesen ({e}): {len(e.prices)} Preise übernommen.")
+            partial_prices.append(e.prices)
+        except Exception as e:
+            log(f"Fehler bei Preisliste {path.name}: {e}")
+    prices = pd.concat([catalog.merged(list_ids), *partial_prices])
+    return prices[~prices.index.duplicated(keep="last")]
+
+
+def _delivery_text(path: str) -> str:
+    # Runs inside a pool worker: no nested extraction pool
+    try:
+        return "\n".join(extract_page_texts(path, workers=1))
+    except Exception as e:
+        logger.warning("Lieferschein %s nicht lesbar: %s", Path(path).name, e)
+        return ""
+
+
+def _init_worker(price_db: pd.Series, delivery_index: Optional[DeliveryNoteIndex],
+                 out_dir: str, output_format: str, supplier: str) -> None:
+    _worker_state.update(price_db=price_db, delivery_index=delivery_index,
+                         out_dir=out_dir, output_format=output_format, supplier=supplier,
+                         parser=InvoiceParser(workers=1), history=get_line_history())
+
+
+def _audit_one(invoice_path: str) -> Dict[str, Any]:
+    """
+    Worker: parses and reconciles one invoice, checks it against the line
+    history and records it there, writes its result file and returns the
+    summary row (the result frame itself stays in the worker).
+    """
+    started = time.perf_counter()
+    state = _worker_state
+    try:
+        with tracing.trace("batch_audit", invoice=Path(invoice_path).name):
+            with tracing.span("parse_invoice") as span:
+                df_invoice = state["parser"].parse_pdf(invoice_path)
+                span["lines"] = len(df_invoice)
+            with tracing.span("reconcile", lines=len(df_invoice)):
+                df = reconcile(df_invoice, state["price_db"], state["delivery_index"])
+            invoice_key = content_hash(invoice_path)
+            with tracing.span("history_check", lines=len(df)):
+                df = state["history"].check(df, state["supplier"], invoice_key)
+            with tracing.span("history_record", lines=len(df)):
+                state["history"].record(state["supplier"], invoice_key, Path(invoice_path).name, df)
+            out_path = Path(state["out_dir"]) / f"{Path(invoice_path).stem}.{state['output_format']}"
+            with tracing.span("write_result", format=state["output_format"]):
+                if state["output_format"] == "parquet":
+                    df.assign(Handlung=df["Handlung"].astype(str)).to_parquet(out_path, index=False)
+                else:
+                    df.to_csv(out_path, index=False, sep=";")
+        counts = status_counts(df)
+        return {"Rechnung": Path(invoice_path).name, "Positionen": counts["total"], "OK": counts["ok"],
+                "Preisfehler": counts["price"], "LS-Fehler": counts["ls"], "Lieferfehler": counts["delivery"],
+                "Doppelt berechnet": counts["duplicate"], "Ergebnis": out_path.name, "Fehler": "",
+                "Sekunden": round(time.perf_counter() - started, 2)}
+    except Exception as e:
+        return {"Rechnung": Path(invoice_path).name, "Positionen": 0, "OK": 0, "Preisfehler": 0, "LS-Fehler": 0,
+                "Lieferfehler": 0, "Doppelt berechnet": 0, "Ergebnis": "", "Fehler": str(e),
+                "Sekunden": round(time.perf_counter() - started, 2)}
+
+
+def run_batch(invoice_paths: Sequence[os.PathLike], price_db: pd.Series,
+              delivery_paths: Sequence[os.PathLike], out_dir: os.PathLike,
+              output_format: str = "csv", workers: Optional[int] = None,
+              supplier: str = "Kammerer", log=print) -> pd.DataFrame:
+    """
+    Audits all invoices on a process pool (one invoice per task) and writes one
+    result file per invoice plus summary.csv into out_dir. Delivery notes are
+    extracted in the same pool and indexed once in the parent.
+    Returns the summary frame.
+    """
+    check_output_format(output_format)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        delivery_index = None
+        if delivery_paths:
+            texts = pool.map(_delivery_text, [str(p) for p in delivery_paths])
+            delivery_index = DeliveryNoteIndex.from_texts(texts, InvoiceParser(workers=1))
+            log(f"{len(delivery_paths)} Lieferscheine indexiert ({len(delivery_index)} LS-Nummern)")
+
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(price_db, delivery_index, str(out_dir), output_format, supplier)) as pool:
+        rows = []
+        futures = [pool.submit(_audit_one, str(p)) for p in invoice_paths]
+        for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            row = future.result()
+            rows.append(row)
+            log(f"[{done}/{len(futures)}] {row['Rechnung']}: {row['Positionen']} Positionen"
+                + (f" FEHLER: {row['Fehler']}" if row["Fehler"] else ""))
+
+    elapsed = time.perf_counter() - started
+    summary = pd.DataFrame(rows).sort_values("Rechnung", ignore_index=True) if rows else pd.DataFrame()
+    summary.to_csv(out_dir / "summary.csv", index=False, sep=";")
+    per_minute = len(rows) / elapsed * 60 if elapsed > 0 else 0.0
+    log(f"{len(rows)} Rechnungen in {elapsed:.1f} s ({per_minute:.1f} Rechnungen/min)")
+    return summary
@@ -0,0 +1,120 @@
+import re
+import pandas as pd
+from typing import Dict, Iterable, List, Optional, Set
+
+from modules.parser import InvoiceParser
+
+
+class DeliveryNoteIndex:
+    """
+    Lookup structure over the uploaded delivery notes, built once at ingestion.
+    Maps every LS-Nr found in the notes to the articles and quantities listed
+    below it, so the audit can check "LS present", "article delivered" and
+    "quantity delivered" with dict lookups instead of substring searches over
+    the concatenated delivery text.
+    """
+
+    # Fallback for delivery-note lines without prices: "867130 Plum 0,7l 10 Fla"
+    qty_pattern = re.compile(r'\s(\d+(?:[.,]\d+)?)\s*([A-Za-z]{2,5})\.?$')
+
+    def __init__(self, parser: Optional[InvoiceParser] = None, keep_sections: bool = False):
+        self.parser = parser or InvoiceParser()
+        self.ls_numbers: Set[str] = set()
+        # LS-Nr -> {Artikel-Nr -> delivered quantity}
+        self.items: Dict[str, Dict[str, float]] = {}
+        # LS-Nr -> raw lines of its delivery note (only with keep_sections, for LLM prompts)
+        self.keep_sections = keep_sections
+        self.sections: Dict[str, List[str]] = {}
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str], parser: Optional[InvoiceParser] = None,
+                   keep_sections: bool = False) -> "DeliveryNoteIndex":
+        index = cls(parser, keep_sections)
+        for text in texts:
+            index.add_text(text)
+        return index
+
+    def add_text(self, text: str) -> Set[str]:
+        """
+        Adds one delivery-note document (all pages as one text).
+        Item lines are attributed to the LS numbers of the closest header block above them.
+        Returns the LS numbers of the document (the entries it added or extended).
+        """
+        if not text:
+            return set()
+        found_ls = self.parser.extract_ls_numbers_from_text(text)
+        self.ls_numbers |= found_ls
+
+        current_ls: Set[str] = set()
+        in_items = False
+        for line in text.split('\n'):
+            line = line.strip()
+            match = self.parser.simple_item_start.match(line)
+            if not match:
+                found = self.parser.extract_ls_numbers_from_text(line)
+                if found:
+                    # A header block may spread its numbers over several lines
+                    # (LS-Nr, customer no., ...); a new block starts after item lines.
+                    current_ls = found if in_items else current_ls | found
+                    in_items = False
+                self._add_section_line(current_ls, line)
+                continue
+            self._add_section_line(current_ls, line)
+            if not current_ls:
+                continue
+            in_items = True
+            art_nr = match.group(1)
+            qty = self._parse_quantity(line[len(art_nr):].strip())
+            for ls_nr in current_ls:
+                articles = self.items.setdefault(ls_nr, {})
+                articles[art_nr] = articles.get(art_nr, 0.0) + qty
+        return found_ls
+
+    def _add_section_line(self, ls_numbers: Set[str], line: str) -> None:
+        if self.keep_sections and line:
+            for ls_nr in ls_numbers:
+                self.sections.setdefault(ls_nr, []).append(line)
+
+    def section_text(self, ls_numbers: Iterable[str]) -> str:
+        """
+        Text of the delivery notes for the given LS numbers (requires keep_sections).
+        """
+        return "\n\n".join("\n".join(self.sections[ls_nr]) for ls_nr in sorted(ls_numbers) if ls_nr in self.sections)
+
+    def _parse_quantity(self, rest: str) -> float:
+        details_match = self.parser.end_pattern.search(rest)
+        if details_match:
+            return float(details_match.group(1))
+        qty_match = self.qty_pattern.search(rest)
+        if qty_match:
+            return float(qty_match.group(1).replace('.', '').replace(',', '.'))
+        return 0.0
+
+    def __contains__(self, ls_nr: str) -> bool:
+        return ls_nr in self.ls_numbers
+
+    def __len__(self) -> int:
+        return len(self.ls_numbers)
+
+    def articles(self, ls_nr: str) -> Dict[str, float]:
+        """
+        Articles listed on a delivery note (empty if the note's items could not be parsed).
+        """
+        return self.items.get(ls_nr, {})
+
+    def delivered_qty(self, ls_nr: str, art_nr: str) -> Optional[float]:
+        """
+        Delivered quantity of an article on a delivery note.
+        None if the note has no parsed items (nothing can be said), 0.0 if the article is not on it.
+        """
+        articles = self.items.get(ls_nr)
+        if not articles:
+            return None
+        return articles.get(art_nr, 0.0)
+
+    def delivered_frame(self) -> pd.DataFrame:
+        """
+        All (LS-Nr, Artikel-Nr, Geliefert) entries as a DataFrame for columnar joins.
+        """
+        rows = [(ls_nr, art_nr, qty) for ls_nr, articles in self.items.items() for art_nr, qty in articles.items()]
+        return pd.DataFrame(rows, columns=["LS-Nr", "Artikel-Nr", "Geliefert"])
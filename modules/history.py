@@ -0,0 +1,185 @@
+import time
+import numpy as np
+import pandas as pd
+from typing import Iterable, List, Optional, Tuple
+
+from modules.storage import connect
+from modules.reconcile import (DUPLICATE_BILLING, PRICE_DRIFT, PRICE_ERROR, PRICE_TOLERANCE, parse_german_number,
+                               status_to_labels)
+
+# Result columns filled by LineHistory.check
+BILLED_COLUMN = "Bereits berechnet"
+PREVIOUS_PRICE_COLUMN = "Vorpreis"
+# Page cache of a bulk ingestion (KiB)
+BULK_CACHE_KB = 128 * 1024
+
+
+def _line_keys(df: pd.DataFrame):
+    ls_nr = df.get("Rechnung LS-Nr", pd.Series("", index=df.index)).fillna("").astype(str)
+    art_nr = df.get("Artikel-Nr", pd.Series("", index=df.index)).fillna("").astype(str)
+    return ls_nr.to_numpy(), art_nr.to_numpy()
+
+
+class LineHistory:
+    """
+    Persistent index of every audited invoice line (supplier, invoice, LS-Nr,
+    article, quantity, unit price), so an audit can look beyond its own invoice:
+    an LS-Nr + Artikel-Nr already billed on another invoice is double billing,
+    a unit price different from the last billed one is price drift.
+
+    Lines are stored in a WITHOUT ROWID table keyed by (invoice, line) and
+    looked up through two covering composite indexes, (supplier, LS-Nr, article)
+    and (supplier, article, invoice), so the checks of one invoice cost one
+    index probe per line however many lines have accumulated.
+    """
+
+    def __init__(self, db_name: str = "line_history.sqlite"):
+        self.db_name = db_name
+        with connect(self.db_name) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS invoices (
+                    invoice_id INTEGER PRIMARY KEY,
+                    supplier TEXT NOT NULL,
+                    invoice_key TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    line_count INTEGER NOT NULL,
+                    recorded_at REAL NOT NULL,
+                    UNIQUE (supplier, invoice_key)
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS lines (
+                    invoice_id INTEGER NOT NULL,
+                    line_no INTEGER NOT NULL,
+                    supplier TEXT NOT NULL,
+                    ls_nr TEXT NOT NULL,
+                    art_nr TEXT NOT NULL,
+                    qty REAL NOT NULL,
+                    unit_price REAL NOT NULL,
+                    PRIMARY KEY (invoice_id, line_no)
+                ) WITHOUT ROWID""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_lines_billing ON lines (supplier, ls_nr, art_nr, invoice_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_lines_article "
+                         "ON lines (supplier, art_nr, invoice_id, unit_price)")
+
+    def _invoice_id(self, conn, supplier: str, invoice_key: str) -> Optional[int]:
+        row = conn.execute("SELECT invoice_id FROM invoices WHERE supplier = ? AND invoice_key = ?",
+                           (supplier, invoice_key)).fetchone()
+        return row[0] if row else None
+
+    def record(self, supplier: str, invoice_key: str, name: str, df: pd.DataFrame) -> int:
+        """
+        Stores the lines of an audited invoice (reconciled frame). Recording the
+        same invoice again replaces its lines and keeps its place in the history.
+        Lines without Artikel-Nr (unreadable rows) are left out.
+        """
+        return self.record_many([(supplier, invoice_key, name, df)])[0]
+
+    def record_many(self, invoices: Iterable[Tuple[str, str, str, pd.DataFrame]]) -> List[int]:
+        """
+        Bulk ingestion of (supplier, invoice key, name, frame) tuples: one
+        connection, one transaction and one executemany per invoice. Inserts
+        into the indexes land on random pages, so a larger page cache and a
+        single commit keep the rate flat as the history grows.
+        """
+        invoice_ids = []
+        with connect(self.db_name) as conn:
+            conn.execute(f"PRAGMA cache_size = -{BULK_CACHE_KB}")
+            for supplier, invoice_key, name, df in invoices:
+                ls_nr, art_nr = _line_keys(df)
+                qty = parse_german_number(df.get("Menge", pd.Series(0, index=df.index)), thousands=False).to_numpy()
+                unit_price = (df["Einzelpreis (Inv)"].to_numpy(dtype=float) if "Einzelpreis (Inv)" in df
+                              else np.zeros(len(df)))
+                keep = np.flatnonzero(art_nr != "")
+                invoice_id = self._invoice_id(conn, supplier, invoice_key)
+                if invoice_id is None:
+                    invoice_id = conn.execute(
+                        "INSERT INTO invoices (supplier, invoice_key, name, line_count, recorded_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (supplier, invoice_key, name, len(keep), time.time()),
+                    ).lastrowid
+                else:
+                    conn.execute("UPDATE invoices SET name = ?, line_count = ?, recorded_at = ? WHERE invoice_id = ?",
+                                 (name, len(keep), time.time(), invoice_id))
+                    conn.execute("DELETE FROM lines WHERE invoice_id = ?", (invoice_id,))
+                conn.executemany(
+                    "INSERT INTO lines (invoice_id, line_no, supplier, ls_nr, art_nr, qty, unit_price) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    zip([invoice_id] * len(keep), keep.tolist(), [supplier] * len(keep), ls_nr[keep].tolist(),
+                        art_nr[keep].tolist(), qty[keep].tolist(), unit_price[keep].tolist()),
+                )
+                invoice_ids.append(invoice_id)
+        return invoice_ids
+
+    def check(self, df: pd.DataFrame, supplier: str, invoice_key: str,
+              tolerance: float = PRICE_TOLERANCE) -> pd.DataFrame:
+        """
+        Flags the lines of a reconciled frame against the history of the supplier
+        (other invoices only, so re-auditing an invoice does not find itself):
+        DUPLICATE_BILLING with the earlier invoices in "Bereits berechnet" and
+        PRICE_DRIFT with the unit price of the last recorded invoice in "Vorpreis"
+        (unless the current price list confirms the new price).
+        The keys of the frame go into a temporary table and are joined against
+        the indexes, one query per check instead of one per line.
+        """
+        df = df.copy()
+        df[BILLED_COLUMN] = pd.Series(np.nan, index=df.index, dtype=object)
+        df[PREVIOUS_PRICE_COLUMN] = np.nan
+        if df.empty:
+            return df
+        ls_nr, art_nr = _line_keys(df)
+        with connect(self.db_name) as conn:
+            invoice_id = self._invoice_id(conn, supplier, invoice_key)
+            invoice_id = -1 if invoice_id is None else invoice_id
+            conn.execute("CREATE TEMP TABLE probe (pos INTEGER PRIMARY KEY, ls_nr TEXT NOT NULL, art_nr TEXT NOT NULL)")
+            conn.executemany("INSERT INTO probe (pos, ls_nr, art_nr) VALUES (?, ?, ?)",
+                             zip(range(len(df)), ls_nr.tolist(), art_nr.tolist()))
+            billed = pd.read_sql_query(
+                "SELECT p.pos, GROUP_CONCAT(DISTINCT i.name) AS invoices FROM probe p "
+                "JOIN lines l ON l.supplier = ? AND l.ls_nr = p.ls_nr AND l.art_nr = p.art_nr AND l.invoice_id != ? "
+                "JOIN invoices i ON i.invoice_id = l.invoice_id "
+                "WHERE p.ls_nr NOT IN ('', 'UNKNOWN') AND p.art_nr != '' GROUP BY p.pos",
+                conn, params=(supplier, invoice_id))
+            previous = pd.read_sql_query(
+                "SELECT a.art_nr, (SELECT l.unit_price FROM lines l WHERE l.supplier = ? AND l.art_nr = a.art_nr "
+                "AND l.invoice_id != ? ORDER BY l.invoice_id DESC LIMIT 1) AS price "
+                "FROM (SELECT DISTINCT art_nr FROM probe WHERE art_nr != '') a",
+                conn, params=(supplier, invoice_id))
+            conn.execute("DROP TABLE probe")
+
+        status = df["Status"].to_numpy(dtype=np.uint8).copy()
+        if len(billed):
+            positions = billed["pos"].to_numpy()
+            df.iloc[positions, df.columns.get_loc(BILLED_COLUMN)] = billed["invoices"].str.replace(",", ", ").to_numpy()
+            status[positions] |= DUPLICATE_BILLING
+        previous_price = pd.Series(previous["price"].to_numpy(dtype=float), index=previous["art_nr"].to_numpy())
+        previous_price = previous_price.reindex(art_nr).to_numpy()
+        unit_price = df["Einzelpreis (Inv)"].to_numpy(dtype=float)
+        drift = ~np.isnan(previous_price) & (unit_price > 0) & (np.abs(unit_price - np.nan_to_num(previous_price)) > tolerance)
+        if "Listenpreis" in df:
+            # A change the current price list confirms is a regular price update, not drift
+            confirmed = df["Listenpreis"].notna().to_numpy() & ((status & PRICE_ERROR) == 0)
+            drift &= ~confirmed
+        status |= np.where(drift, PRICE_DRIFT, 0).astype(np.uint8)
+        df[PREVIOUS_PRICE_COLUMN] = previous_price
+        df["Status"] = status
+        df["Handlung"] = status_to_labels(df["Status"])
+        return df
+
+    def stats(self, supplier: Optional[str] = None) -> pd.DataFrame:
+        query = "SELECT supplier, COUNT(*) AS invoices, SUM(line_count) AS lines FROM invoices"
+        params: tuple = ()
+        if supplier is not None:
+            query += " WHERE supplier = ?"
+            params = (supplier,)
+        with connect(self.db_name) as conn:
+            return pd.read_sql_query(query + " GROUP BY supplier ORDER BY supplier", conn, params=params)
+
+
+_default_history: Optional[LineHistory] = None
+
+
+def get_line_history() -> LineHistory:
+    global _default_history
+    if _default_history is None:
+        _default_history = LineHistory()
+    return _default_history
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, List, Optional, Set
+
+from modules.reconcile import status_to_labels
+
+# Columns of the invoice lines a result row depends on
+LS_COLUMN = "Rechnung LS-Nr"
+ART_COLUMN = "Artikel-Nr"
+
+
+class AuditState:
+    """
+    Everything a finished audit needs to be re-evaluated when a delivery note or
+    price list is handed in later: the parsed invoice lines, the delivery note
+    index (and texts, for KI prompts), the prices, the content hashes of the
+    ingested files, the invoice's key in the line history and the result.
+
+    Every invoice row depends on its LS-Nr (delivery checks) and its Artikel-Nr
+    (price check); both are indexed once, so the rows affected by new documents
+    are found with dict lookups.
+    """
+
+    def __init__(self, invoice: pd.DataFrame, result: pd.DataFrame, delivery_index=None,
+                 delivery_texts: Optional[List[str]] = None, prices: Optional[pd.Series] = None,
+                 file_hashes: Iterable[str] = (), supplier: str = "Kammerer", invoice_key: str = ""):
+        self.invoice = invoice
+        self.result = result
+        self.delivery_index = delivery_index
+        self.delivery_texts = list(delivery_texts or [])
+        self.prices = prices if prices is not None else pd.Series(dtype=float)
+        self.file_hashes: Set[str] = set(file_hashes)
+        self.supplier = supplier
+        # Content hash of the invoice, its key in the line history
+        self.invoice_key = invoice_key
+        self.rows_by_ls = _row_positions(invoice, LS_COLUMN)
+        self.rows_by_article = _row_positions(invoice, ART_COLUMN)
+
+    def affected_rows(self, ls_numbers: Iterable[str] = (), articles: Iterable[str] = ()) -> pd.Index:
+        """
+        Index labels of the invoice rows that depend on any of the given LS or article numbers.
+        """
+        positions = [self.rows_by_ls[ls_nr] for ls_nr in ls_numbers if ls_nr in self.rows_by_ls]
+        positions += [self.rows_by_article[art_nr] for art_nr in articles if art_nr in self.rows_by_article]
+        if not positions:
+            return self.invoice.index[:0]
+        return self.invoice.index[np.unique(np.concatenate(positions))]
+
+    def __getstate__(self):
+        # The dependency maps are rebuilt from the invoice on load
+        state = dict(self.__dict__)
+        del state["rows_by_ls"], state["rows_by_article"]
+        return state
+
+    def __setstate__(self, state) -> None:
+        state.setdefault("invoice_key", "")
+        self.__dict__.update(state)
+        self.rows_by_ls = _row_positions(self.invoice, LS_COLUMN)
+        self.rows_by_article = _row_positions(self.invoice, ART_COLUMN)
+
+
+def _row_positions(df: pd.DataFrame, column: str) -> Dict[str, np.ndarray]:
+    # value -> positions of the rows with that value
+    if column not in df or df.empty:
+        return {}
+    keys = df[column].fillna("").astype(str)
+    return keys.groupby(keys.to_numpy(), sort=False).indices
+
+
+def changed_prices(old: pd.Series, new: pd.Series) -> Set[str]:
+    """
+    Articles whose list price is new or different in new compared to old.
+    """
+    if new is None or not len(new):
+        return set()
+    before = old.reindex(new.index)
+    return set(new.index[before.isna().to_numpy() | (before.to_numpy() != new.to_numpy())].astype(str))
+
+
+def merge_rows(result: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    The result with the re-evaluated rows replaced (matched by index). Columns
+    the old result lacks (e.g. "Menge Geliefert" after the first delivery note,
+    "Quelle" after a KI review) are added; untouched rows were decided by the rules.
+    """
+    merged = result.copy()
+    for col in rows.columns:
+        if col not in merged:
+            merged[col] = "Regel" if col == "Quelle" else np.nan
+    for col in rows.columns.drop("Handlung", errors="ignore"):
+        merged.loc[rows.index, col] = rows[col]
+    if "Quelle" in merged and "Quelle" not in rows:
+        merged.loc[rows.index, "Quelle"] = "Regel"
+    merged["Status"] = merged["Status"].astype(np.uint8)
+    merged["Handlung"] = status_to_labels(merged["Status"])
+    return merged
@@ -0,0 +1,155 @@
+import os
+import time
+import tempfile
+import contextlib
+import concurrent.futures
+import pdfplumber
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from modules.storage import spool_to
+from modules import tracing
+
+# Processes for CPU-bound documents read side by side (default: all cores)
+INGEST_WORKERS = int(os.getenv("AUDIT_INGEST_WORKERS", "0")) or (os.cpu_count() or 1)
+
+
+@contextlib.contextmanager
+def spooled_path(file_stream: Any) -> Iterator[str]:
+    """
+    A path for the document: paths are used as they are, uploads are spooled to
+    a temporary file (removed afterwards). Worker processes open the path
+    instead of receiving a pickled copy of the whole file.
+    """
+    if isinstance(file_stream, (str, os.PathLike)):
+        yield os.fspath(file_stream)
+        return
+    fd, path = tempfile.mkstemp(suffix=".pdf", prefix="audit-spool-")
+    os.close(fd)
+    try:
+        spool_to(file_stream, path)
+        yield path
+    finally:
+        os.unlink(path)
+
+
+@contextlib.contextmanager
+def open_pdf(file_stream: Any) -> Iterator[pdfplumber.PDF]:
+    """
+    Opens a PDF for page-wise extraction from a file on disk (uploads are
+    spooled first), so the document is read as needed instead of held in memory.
+    """
+    with spooled_path(file_stream) as path, pdfplumber.open(path) as pdf:
+        yield pdf
+
+
+def release_page(pdf: pdfplumber.PDF, page) -> None:
+    """
+    Drops what pdfplumber and pdfminer keep after a page was extracted: the
+    page's parsed objects and layout, and the document's cache of resolved PDF
+    objects (which holds the raw image streams of scanned pages). Shared
+    objects such as fonts are parsed again when a later page needs them.
+    """
+    page.close()
+    cached_objects = getattr(pdf.doc, "_cached_objs", None)
+    if cached_objects is not None:
+        cached_objects.clear()
+
+
+def iter_pages(pdf: pdfplumber.PDF, page_indices: Iterable[int]) -> Iterator[Tuple[int, Any]]:
+    """
+    Yields (index, page) and releases every page once the consumer moves on,
+    so memory stays flat however many pages the document has.
+    """
+    for idx in page_indices:
+        page = pdf.pages[idx]
+        try:
+            yield idx, page
+        finally:
+            release_page(pdf, page)
+
+
+class IngestTask(NamedTuple):
+    """
+    One input document of an audit: role and name (for progress messages),
+    fn(*args, workers=...) producing its result, and whether the work is
+    CPU-bound (PDF parsing) or waits on the network (LLM extraction).
+    workers is passed on to the page-level extraction of the document.
+    """
+    role: str
+    name: str
+    fn: Callable[..., Any]
+    args: Tuple[Any, ...]
+    cpu: bool = True
+
+
+def _timed(fn: Callable[..., Any], args: Tuple[Any, ...], workers: Optional[int]) -> Tuple[Any, float]:
+    # Runs in a pool process or thread; the time is the task's own, without queueing
+    started = time.perf_counter()
+    result = fn(*args, workers=workers)
+    return result, time.perf_counter() - started
+
+
+def _timed_in_process(fn: Callable[..., Any], args: Tuple[Any, ...],
+                      workers: Optional[int]) -> Tuple[Any, float, List[dict], Optional[BaseException]]:
+    # Runs in a pool process: its spans are collected there and sent back with
+    # the result (or the error), so they end up in the caller's trace
+    with tracing.capture() as run:
+        try:
+            result, seconds = _timed(fn, args, workers)
+        except Exception as e:
+            return None, 0.0, run.records(), e
+    return result, seconds, run.records(), None
+
+
+def run_pipelined(tasks: List[IngestTask], workers: Optional[int] = None,
+                  on_done: Optional[Callable[[IngestTask, float, Optional[BaseException]], None]] = None) -> List[Any]:
+    """
+    Reads all documents of an audit at the same time instead of one after the
+    other and returns their results in task order.
+    Network-bound tasks each get a thread. CPU-bound tasks share a process pool
+    (one document per process, serial page extraction inside) when there are
+    several of them and more than one worker; otherwise they run one after
+    another on a single thread of this process, where a large document still
+    uses the page-level pool and the network-bound tasks wait alongside.
+    on_done(task, seconds, error) is called as each document finishes.
+    The first error (in task order) is raised once every task has ended.
+    Spans recorded in pool processes are added to the current trace as
+    children of the current span, like those of the threads.
+    """
+    workers = INGEST_WORKERS if workers is None else workers
+    cpu_count = sum(task.cpu for task in tasks)
+    use_processes = workers > 1 and cpu_count > 1
+    results: List[Any] = [None] * len(tasks)
+    errors: List[Optional[BaseException]] = [None] * len(tasks)
+    with contextlib.ExitStack() as stack:
+        if use_processes:
+            cpu_pool = stack.enter_context(concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, cpu_count)))
+        else:
+            # A single thread: CPU-bound documents would only compete for the GIL
+            cpu_pool = stack.enter_context(concurrent.futures.ThreadPoolExecutor(max_workers=1))
+        io_pool = stack.enter_context(concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, len(tasks) - cpu_count)))
+        futures = {}
+        for i, task in enumerate(tasks):
+            if task.cpu and use_processes:
+                futures[cpu_pool.submit(_timed_in_process, task.fn, task.args, 1)] = i
+            else:
+                pool = cpu_pool if task.cpu else io_pool
+                futures[pool.submit(tracing.bind(_timed), task.fn, task.args, None)] = i
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            seconds = 0.0
+            try:
+                if tasks[i].cpu and use_processes:
+                    results[i], seconds, records, errors[i] = future.result()
+                    tracing.adopt(records)
+                else:
+                    results[i], seconds = future.result()
+            except Exception as e:
+                errors[i] = e
+            if on_done:
+                on_done(tasks[i], seconds, errors[i])
+    for error in errors:
+        if error is not None:
+            raise error
+    return results
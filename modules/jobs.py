@@ -0,0 +1,355 @@
+import os
+import json
+import time
+import uuid
+import pickle
+import shutil
+import datetime
+import threading
+import multiprocessing
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from modules.storage import connect, data_dir, spool_to
+from modules import tracing
+
+if TYPE_CHECKING:
+    # Imported where needed: the app imports this module for its first page
+    import pandas as pd
+
+# Worker processes per server process (one audit each at a time)
+JOB_WORKERS = int(os.getenv("AUDIT_JOB_WORKERS", "2"))
+# A running job whose worker has not sent a heartbeat for this long is requeued
+STALE_AFTER_S = float(os.getenv("AUDIT_JOB_STALE_S", "60"))
+# A job whose worker died this many times is failed instead of requeued again
+MAX_ATTEMPTS = int(os.getenv("AUDIT_JOB_MAX_ATTEMPTS", "3"))
+HEARTBEAT_S = 10.0
+POLL_INTERVAL_S = 1.0
+# Finished jobs (rows and files) are removed after this many days
+KEEP_DAYS = float(os.getenv("AUDIT_JOB_KEEP_DAYS", "7"))
+# Intermediate results are written at most this often
+PARTIAL_INTERVAL_S = 2.0
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobStore:
+    """
+    SQLite-backed job table. Inputs and results of a job live in
+    data_dir("jobs", job_id); the row holds status, progress and the step log,
+    so any Streamlit session (or a reconnecting browser) can follow a job by id.
+    """
+
+    def __init__(self, db_name: str = "jobs.sqlite"):
+        self.db_name = db_name
+        with connect(self.db_name) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    log TEXT NOT NULL DEFAULT '',
+                    error TEXT,
+                    worker TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    heartbeat REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )""")
+            # Job tables created before attempts were counted
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "attempts" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
+    def job_dir(self, job_id: str, *parts: str) -> Path:
+        return data_dir("jobs", job_id, *parts)
+
+    def create(self, kind: str, params: Dict[str, Any], files: Dict[str, Sequence[Tuple[str, Any]]]) -> str:
+        """
+        Stores the input files (role -> [(file name, content)]) and queues the job.
+        Content is bytes or a file-like object (an upload), which is copied to
+        disk in chunks instead of as one more in-memory copy.
+        The handler receives the stored paths per role in params["files"].
+        """
+        job_id = uuid.uuid4().hex
+        stored: Dict[str, List[str]] = {}
+        for role, role_files in files.items():
+            for i, (name, content) in enumerate(role_files):
+                # One directory per file keeps the original name even for duplicates
+                path = self.job_dir(job_id, "inputs", role, str(i)) / Path(name).name
+                spool_to(content, path)
+                stored.setdefault(role, []).append(str(path))
+        params = dict(params, files=stored)
+        with connect(self.db_name) as conn:
+            conn.execute("INSERT INTO jobs (job_id, kind, status, params, created_at) VALUES (?, ?, ?, ?, ?)",
+                         (job_id, kind, QUEUED, json.dumps(params, default=str), time.time()))
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with connect(self.db_name) as conn:
+            conn.row_factory = _dict_row
+            job = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if job:
+            job["params"] = json.loads(job["params"])
+        return job
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """
+        Atomically moves the oldest queued job to running for this worker and
+        counts the attempt.
+        """
+        now = time.time()
+        with connect(self.db_name) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT job_id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET status = ?, worker = ?, started_at = ?, heartbeat = ?, progress = 0, "
+                         "attempts = attempts + 1 WHERE job_id = ?",
+                         (RUNNING, worker, now, now, row[0]))
+        return self.get(row[0])
+
+    def heartbeat(self, job_id: str) -> None:
+        with connect(self.db_name) as conn:
+            conn.execute("UPDATE jobs SET heartbeat = ? WHERE job_id = ?", (time.time(), job_id))
+
+    def set_progress(self, job_id: str, progress: float) -> None:
+        with connect(self.db_name) as conn:
+            conn.execute("UPDATE jobs SET progress = ?, heartbeat = ? WHERE job_id = ?", (progress, time.time(), job_id))
+
+    def append_log(self, job_id: str, message: str) -> None:
+        with connect(self.db_name) as conn:
+            conn.execute("UPDATE jobs SET log = log || ? || char(10), heartbeat = ? WHERE job_id = ?",
+                         (message, time.time(), job_id))
+
+    def finish(self, job_id: str, error: Optional[str] = None) -> None:
+        with connect(self.db_name) as conn:
+            conn.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ?, progress = ? WHERE job_id = ?",
+                         (FAILED if error else DONE, error, time.time(), 0 if error else 1, job_id))
+
+    def requeue_stale(self) -> int:
+        """
+        Puts running jobs of dead workers back into the queue. Re-running is cheap:
+        page texts, LLM answers and price lists come from their caches.
+        A job that already had MAX_ATTEMPTS attempts (e.g. an input that crashes
+        every worker) is failed instead. Returns the number of requeued jobs.
+        """
+        stale = time.time() - STALE_AFTER_S
+        with connect(self.db_name) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, error = ?, finished_at = ?, progress = 0 "
+                "WHERE status = ? AND heartbeat < ? AND attempts >= ?",
+                (FAILED, f"Worker {MAX_ATTEMPTS}-mal abgebrochen, Auftrag wird nicht erneut gestartet",
+                 time.time(), RUNNING, stale, MAX_ATTEMPTS))
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, log = log || ? WHERE status = ? AND heartbeat < ?",
+                (QUEUED, "🔁 Neu gestartet (Worker abgebrochen)\n", RUNNING, stale))
+            return cursor.rowcount
+
+    def purge(self, keep_days: float = KEEP_DAYS) -> None:
+        cutoff = time.time() - keep_days * 86400
+        with connect(self.db_name) as conn:
+            old = [r[0] for r in conn.execute("SELECT job_id FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                                              (DONE, FAILED, cutoff))]
+            conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(job_id,) for job_id in old])
+        for job_id in old:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    # Results are pickled frames: keeps dtypes (categoricals, NaN) without extra dependencies
+
+    def save_result(self, job_id: str, df: "pd.DataFrame", partial: bool = False) -> None:
+        path = self.job_dir(job_id) / ("partial.pkl" if partial else "result.pkl")
+        tmp = path.with_suffix(".tmp")
+        df.to_pickle(tmp)
+        os.replace(tmp, path)
+
+    def load_result(self, job_id: str, partial: bool = False) -> Optional["pd.DataFrame"]:
+        import pandas as pd
+        path = self.job_dir(job_id) / ("partial.pkl" if partial else "result.pkl")
+        return pd.read_pickle(path) if path.exists() else None
+
+    def save_state(self, job_id: str, state: Any) -> None:
+        """
+        Inputs of a finished audit (modules.incremental.AuditState) for later update jobs.
+        """
+        path = self.job_dir(job_id) / "state.pkl"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def load_state(self, job_id: str) -> Optional[Any]:
+        path = self.job_dir(job_id) / "state.pkl"
+        if not path.exists():
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def save_trace(self, job_id: str, trace: Dict[str, Any]) -> None:
+        (self.job_dir(job_id) / "trace.json").write_text(json.dumps(trace, default=str), encoding="utf-8")
+
+    def load_trace(self, job_id: str) -> Optional[Dict[str, Any]]:
+        path = self.job_dir(job_id) / "trace.json"
+        return json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+
+
+def _dict_row(cursor, row) -> Dict[str, Any]:
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+
+_default_store: Optional[JobStore] = None
+
+
+def get_job_store() -> JobStore:
+    global _default_store
+    if _default_store is None:
+        _default_store = JobStore()
+    return _default_store
+
+
+# --- HANDLERS ---
+
+def _partial_saver(store: JobStore, job_id: str) -> Callable[["pd.DataFrame"], None]:
+    last_partial = 0.0
+
+    def on_update(df: "pd.DataFrame") -> None:
+        nonlocal last_partial
+        if time.monotonic() - last_partial >= PARTIAL_INTERVAL_S:
+            store.save_result(job_id, df, partial=True)
+            last_partial = time.monotonic()
+    return on_update
+
+
+def run_audit_job(store: JobStore, job: Dict[str, Any]) -> None:
+    """
+    Runs modules.pipeline.start_audit with the job's stored inputs.
+    """
+    from modules.pipeline import start_audit
+    job_id, params = job["job_id"], job["params"]
+    files = params.get("files", {})
+
+    # Timings and token usage are kept next to the result (also for failed runs);
+    # run stays None if the trace could not be opened, so that error is not masked
+    run = None
+    try:
+        with tracing.trace("audit", job_id=job_id, invoice=Path(files["invoice"][0]).name) as run:
+            state = start_audit(
+                files["invoice"][0],
+                delivery_files=files.get("delivery", []),
+                price_files=files.get("prices", []),
+                supplier=params.get("supplier", "Kammerer"),
+                valid_from=datetime.date.fromisoformat(params["valid_from"]) if params.get("valid_from") else None,
+                use_stored_prices=params.get("use_stored_prices", True),
+                ai_review=params.get("ai_review", False),
+                bypass_cache=params.get("bypass_cache", False),
+                log=lambda message: store.append_log(job_id, message),
+                progress=lambda fraction: store.set_progress(job_id, fraction),
+                on_update=_partial_saver(store, job_id),
+            )
+    finally:
+        if run is not None:
+            store.save_trace(job_id, run.to_dict())
+    store.save_state(job_id, state)
+    store.save_result(job_id, state.result)
+
+
+def run_update_job(store: JobStore, job: Dict[str, Any]) -> None:
+    """
+    Runs modules.pipeline.update_audit on the state of a finished audit job
+    (params["base_job"]) with the delivery notes / price lists handed in later.
+    The updated state is stored with this job, so updates can be chained.
+    """
+    from modules.pipeline import update_audit
+    job_id, params = job["job_id"], job["params"]
+    files = params.get("files", {})
+    state = store.load_state(params["base_job"])
+    if state is None:
+        raise ValueError("Die ursprüngliche Prüfung ist nicht mehr vorhanden; bitte neu starten.")
+    run = None
+    try:
+        with tracing.trace("audit_update", job_id=job_id, base_job=params["base_job"]) as run:
+            state = update_audit(
+                state,
+                delivery_files=files.get("delivery", []),
+                price_files=files.get("prices", []),
+                valid_from=datetime.date.fromisoformat(params["valid_from"]) if params.get("valid_from") else None,
+                ai_review=params.get("ai_review", False),
+                bypass_cache=params.get("bypass_cache", False),
+                log=lambda message: store.append_log(job_id, message),
+                progress=lambda fraction: store.set_progress(job_id, fraction),
+                on_update=_partial_saver(store, job_id),
+            )
+    finally:
+        if run is not None:
+            store.save_trace(job_id, run.to_dict())
+    store.save_state(job_id, state)
+    store.save_result(job_id, state.result)
+
+
+JOB_HANDLERS = {"audit": run_audit_job, "audit_update": run_update_job}
+
+
+# --- WORKER ---
+
+def run_job(store: JobStore, job: Dict[str, Any]) -> None:
+    job_id = job["job_id"]
+    stop = threading.Event()
+
+    def beat() -> None:
+        # Long steps (e.g. extracting a big PDF) report nothing for a while
+        while not stop.wait(HEARTBEAT_S):
+            store.heartbeat(job_id)
+
+    threading.Thread(target=beat, daemon=True).start()
+    try:
+        JOB_HANDLERS[job["kind"]](store, job)
+    except Exception as e:
+        store.append_log(job_id, f"❌ {e}")
+        store.finish(job_id, error=str(e))
+    else:
+        store.finish(job_id)
+    finally:
+        stop.set()
+
+
+def worker_loop(parent_pid: Optional[int] = None, poll_interval: float = POLL_INTERVAL_S) -> None:
+    """
+    Entry point of a worker process: claims and runs queued jobs one at a time.
+    Exits once the server process (parent_pid) is gone.
+    """
+    from dotenv import load_dotenv
+    load_dotenv(Path(__file__).resolve().parent.parent / ".env", override=True)
+    store = JobStore()
+    worker = f"{os.getpid()}"
+    store.purge()
+    while parent_pid is None or os.getppid() == parent_pid:
+        store.requeue_stale()
+        job = store.claim(worker)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        run_job(store, job)
+
+
+_workers: List[multiprocessing.Process] = []
+_workers_lock = threading.Lock()
+
+
+def ensure_workers(count: int = JOB_WORKERS) -> None:
+    """
+    Starts the worker processes of this server process (once; dead ones are replaced).
+    Spawned, not forked: the Streamlit server process is multi-threaded. Not daemonic,
+    so a worker can still use a process pool for page extraction; it stops by itself
+    when the server exits.
+    """
+    with _workers_lock:
+        _workers[:] = [p for p in _workers if p.is_alive()]
+        ctx = multiprocessing.get_context("spawn")
+        while len(_workers) < count:
+            process = ctx.Process(target=worker_loop, args=(os.getpid(),), name="audit-job-worker")
+            process.start()
+            _workers.append(process)
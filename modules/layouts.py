@@ -0,0 +1,107 @@
+import re
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from pdfminer.layout import LTChar, LTContainer
+from pdfplumber.utils import extract_text
+
+from modules.ingest import release_page
+
+# Pages used to learn the item-table region of a document
+LEARN_SAMPLE_PAGES = 3
+# Cache mode of pages extracted with a learned region (deterministic per file content)
+AUTO_MODE = "table:auto"
+
+
+class TableLayout(NamedTuple):
+    """
+    Item-table region of an invoice layout: the bands cut off at the top
+    (letterhead, address block) and bottom (totals, footer) of every page, in
+    PDF points, plus the pdfplumber extract_text parameters used inside it.
+    left is the x position where table lines start; it is used to notice
+    table lines that fall outside the region on an unusual page.
+    """
+    top: float
+    bottom: float
+    left: Optional[float] = None
+    x_tolerance: float = 3
+    y_tolerance: float = 3
+
+    @property
+    def mode(self) -> str:
+        return f"table:{self.top:.1f}:{self.bottom:.1f}:{self.x_tolerance:g}:{self.y_tolerance:g}"
+
+    def extract(self, page) -> str:
+        """
+        Text of the table region of a page. Only the characters inside the
+        region are converted to pdfplumber objects, and the text is assembled
+        with the plain word/line pass instead of the full text map. pdfminer
+        still interprets the whole page, so the saving grows with the share of
+        characters outside the table: a few percent of the parse time when the
+        table fills most of the page (3-7% on real invoices), up to ~15-25% on
+        the benchmark's layout with letterhead and footer (benchmarks.run
+        parse_table_region vs. parse_full_page). Falls back to the whole page
+        if a table line lies outside the region (e.g. a page without letterhead).
+        """
+        x_offset, y_offset = page.mediabox[0], page.mediabox[1]
+        cut_top, cut_bottom = self.top - y_offset, page.height - self.bottom - y_offset
+        inside = []
+        for obj in _iter_chars(page.layout):
+            top, bottom = page.height - obj.y1, page.height - obj.y0
+            if bottom > cut_top and top < cut_bottom:
+                inside.append(obj)
+            elif self.left is not None and abs(obj.x0 + x_offset - self.left) < 1.5 and _starts_table_line(obj.get_text()):
+                return page.extract_text(x_tolerance=self.x_tolerance, y_tolerance=self.y_tolerance) or ""
+        chars = [page.process_object(obj) for obj in inside]
+        return extract_text(chars, x_tolerance=self.x_tolerance, y_tolerance=self.y_tolerance) or ""
+
+
+def _iter_chars(container) -> Iterator[LTChar]:
+    for obj in container:
+        if isinstance(obj, LTChar):
+            yield obj
+        elif isinstance(obj, LTContainer):
+            yield from _iter_chars(obj)
+
+
+def _starts_table_line(text: str) -> bool:
+    # Item lines start with the article number, LS headers with "Lfsch"
+    return text.isdigit() or text == "L"
+
+
+# Measured layouts can be pinned per supplier; suppliers without an entry get
+# their table region learned from the first pages of every document.
+TABLE_LAYOUTS: Dict[str, TableLayout] = {}
+
+
+def learn_table_layout(pdf, line_pattern: re.Pattern, sample_pages: int = LEARN_SAMPLE_PAGES,
+                       texts: Optional[Dict[int, str]] = None) -> Optional[TableLayout]:
+    """
+    Learns the table region from the first pages of an open pdfplumber document:
+    the span of all lines line_pattern matches (item and LS header lines), padded
+    by one line height. None if the sample pages contain no table lines.
+    The sample pages are extracted in full for this; with texts given, their
+    text (the same as page.extract_text()) is stored there by page index, so
+    the caller does not extract them a second time.
+    """
+    tops: List[float] = []
+    bottoms: List[float] = []
+    lefts: List[float] = []
+    height = None
+    for idx, page in enumerate(pdf.pages[:sample_pages]):
+        lines = page.extract_text_lines()
+        if texts is not None:
+            texts[idx] = "\n".join(line["text"] for line in lines)
+        for line in lines:
+            if line_pattern.match(line["text"]):
+                tops.append(line["top"])
+                bottoms.append(line["bottom"])
+                lefts.append(line["x0"])
+        height = page.height if height is None else min(height, page.height)
+        release_page(pdf, page)
+    if not tops:
+        return None
+    pad = max(b - t for t, b in zip(tops, bottoms))
+    return TableLayout(
+        top=max(0.0, min(tops) - pad),
+        bottom=max(0.0, height - max(bottoms) - pad),
+        left=min(lefts),
+    )
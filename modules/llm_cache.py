@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import hashlib
+from typing import Any, Callable, Dict, List, Optional
+
+from modules.storage import connect
+from modules import tracing
+
+# AUDIT_LLM_CACHE=0 bypasses the cache globally (responses are still refreshed).
+CACHE_ENABLED = os.getenv("AUDIT_LLM_CACHE", "1") != "0"
+DEFAULT_TTL_HOURS = float(os.getenv("AUDIT_LLM_CACHE_TTL_H", "168"))
+DEFAULT_MAX_MB = float(os.getenv("AUDIT_LLM_CACHE_MB", "64"))
+
+
+class LLMResponseCache:
+    """
+    Persistent cache for chat completion responses.
+    The key is a hash over the deployment name, the messages and the request
+    parameters, so only byte-identical prompts hit. Entries expire after ttl_seconds;
+    least recently used entries are evicted beyond max_bytes.
+    """
+
+    def __init__(self, db_name: str = "llm_cache.sqlite", ttl_seconds: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.db_name = db_name
+        self.ttl_seconds = DEFAULT_TTL_HOURS * 3600 if ttl_seconds is None else ttl_seconds
+        self.max_bytes = int(DEFAULT_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        with connect(self.db_name) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, Any]], params: Optional[Dict[str, Any]] = None) -> str:
+        payload = json.dumps({"model": model, "messages": messages, "params": params or {}}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with connect(self.db_name) as conn:
+            row = conn.execute("SELECT content, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key: str, model: str, content: str) -> None:
+        now = time.time()
+        with connect(self.db_name) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, content, size, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, content, len(content.encode("utf-8")), now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now: float) -> None:
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        to_free = total - int(self.max_bytes * 0.9)
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            victims.append((key,))
+            to_free -= size
+            if to_free <= 0:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    def clear(self) -> None:
+        with connect(self.db_name) as conn:
+            conn.execute("DELETE FROM responses")
+
+
+_default_cache: Optional[LLMResponseCache] = None
+
+
+def get_llm_cache() -> LLMResponseCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LLMResponseCache()
+    return _default_cache
+
+
+def cached_chat_completion(client, model: str, messages: List[Dict[str, Any]],
+                           parse: Callable[[str], Any] = lambda content: content,
+                           cache: Optional[LLMResponseCache] = None, bypass: bool = False,
+                           **params) -> Any:
+    """
+    client.chat.completions.create through the response cache; returns parse(content).
+    A response is only stored if parse() accepts it, so malformed answers are retried
+    next time. With bypass (or AUDIT_LLM_CACHE=0) the cache is not read, but the fresh
+    response still replaces the stored one.
+    """
+    cache = cache or get_llm_cache()
+    key = cache.make_key(model, messages, params)
+    if CACHE_ENABLED and not bypass:
+        content = cache.get(key)
+        if content is not None:
+            tracing.count(llm_cache_hits=1)
+            return parse(content)
+    response = client.chat.completions.create(model=model, messages=messages, **params)
+    tracing.count_usage(response)
+    content = response.choices[0].message.content
+    result = parse(content)
+    cache.put(key, model, content)
+    return result
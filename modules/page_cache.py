@@ -0,0 +1,153 @@
+import os
+import time
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from modules.storage import connect
+
+# Upper bound for the cached page texts (sum of UTF-8 sizes). 0 disables the cache.
+DEFAULT_MAX_MB = float(os.getenv("AUDIT_PAGE_CACHE_MB", "256"))
+
+
+class PageTextCache:
+    """
+    Persistent cache for extracted PDF page texts.
+    Entries are keyed by (file content hash, extraction mode, page index), so the same
+    invoice or delivery-note bundle is only run through pdfplumber once, no matter how
+    often it is uploaded. Least recently used pages are evicted once the cache grows
+    beyond max_bytes.
+    """
+
+    def __init__(self, db_name: str = "page_cache.sqlite", max_bytes: Optional[int] = None):
+        self.db_name = db_name
+        self.max_bytes = int(DEFAULT_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        if self.enabled:
+            with connect(self.db_name) as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS documents (
+                        file_hash TEXT PRIMARY KEY,
+                        page_count INTEGER NOT NULL
+                    )""")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS pages (
+                        file_hash TEXT NOT NULL,
+                        mode TEXT NOT NULL,
+                        page_index INTEGER NOT NULL,
+                        text TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        last_access REAL NOT NULL,
+                        PRIMARY KEY (file_hash, mode, page_index)
+                    )""")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_last_access ON pages (last_access)")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get_page_count(self, file_hash: str) -> Optional[int]:
+        if not self.enabled:
+            return None
+        with connect(self.db_name) as conn:
+            row = conn.execute("SELECT page_count FROM documents WHERE file_hash = ?", (file_hash,)).fetchone()
+        return row[0] if row else None
+
+    def set_page_count(self, file_hash: str, page_count: int) -> None:
+        if not self.enabled:
+            return
+        with connect(self.db_name) as conn:
+            conn.execute("INSERT OR REPLACE INTO documents (file_hash, page_count) VALUES (?, ?)", (file_hash, page_count))
+
+    def cached_page_indices(self, file_hash: str, mode: str = "text") -> set:
+        if not self.enabled:
+            return set()
+        with connect(self.db_name) as conn:
+            # A document about to be read counts as used, so its pages are not the next eviction victims
+            conn.execute("UPDATE pages SET last_access = ? WHERE file_hash = ? AND mode = ?", (time.time(), file_hash, mode))
+            rows = conn.execute(
+                "SELECT page_index FROM pages WHERE file_hash = ? AND mode = ?", (file_hash, mode)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def get_page(self, file_hash: str, page_index: int, mode: str = "text") -> Optional[str]:
+        if not self.enabled:
+            return None
+        with connect(self.db_name) as conn:
+            row = conn.execute(
+                "SELECT text FROM pages WHERE file_hash = ? AND mode = ? AND page_index = ?", (file_hash, mode, page_index)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE pages SET last_access = ? WHERE file_hash = ? AND mode = ? AND page_index = ?",
+                             (time.time(), file_hash, mode, page_index))
+        return row[0] if row else None
+
+    def iter_pages(self, file_hash: str, mode: str = "text") -> Iterator[Tuple[int, str]]:
+        """
+        Streams the cached pages of a document in page order without loading them all at once.
+        """
+        if not self.enabled:
+            return
+        conn = connect(self.db_name)
+        try:
+            with conn:
+                conn.execute(
+                    "UPDATE pages SET last_access = ? WHERE file_hash = ? AND mode = ?", (time.time(), file_hash, mode)
+                )
+            yield from conn.execute(
+                "SELECT page_index, text FROM pages WHERE file_hash = ? AND mode = ? ORDER BY page_index", (file_hash, mode)
+            )
+        finally:
+            conn.close()
+
+    def put_pages(self, file_hash: str, pages: Dict[int, str], mode: str = "text") -> None:
+        if not self.enabled or not pages:
+            return
+        now = time.time()
+        with connect(self.db_name) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO pages (file_hash, mode, page_index, text, size, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                ((file_hash, mode, idx, text, len(text.encode("utf-8")), now) for idx, text in pages.items()),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn) -> None:
+        """
+        Drops least recently used pages until the cache is back below 90% of max_bytes.
+        """
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        to_free = total - int(self.max_bytes * 0.9)
+        victims = []
+        for file_hash, mode, page_index, size in conn.execute(
+            "SELECT file_hash, mode, page_index, size FROM pages ORDER BY last_access"
+        ):
+            victims.append((file_hash, mode, page_index))
+            to_free -= size
+            if to_free <= 0:
+                break
+        conn.executemany("DELETE FROM pages WHERE file_hash = ? AND mode = ? AND page_index = ?", victims)
+        conn.execute("DELETE FROM documents WHERE file_hash NOT IN (SELECT DISTINCT file_hash FROM pages)")
+
+    def clear(self, file_hashes: Optional[Iterable[str]] = None) -> None:
+        if not self.enabled:
+            return
+        with connect(self.db_name) as conn:
+            if file_hashes is None:
+                conn.execute("DELETE FROM pages")
+                conn.execute("DELETE FROM documents")
+            else:
+                hashes = [(h,) for h in file_hashes]
+                conn.executemany("DELETE FROM pages WHERE file_hash = ?", hashes)
+                conn.executemany("DELETE FROM documents WHERE file_hash = ?", hashes)
+
+
+_default_cache: Optional[PageTextCache] = None
+
+
+def get_page_cache() -> PageTextCache:
+    """
+    Process-wide cache instance shared by the parser and the utils extractors.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PageTextCache()
+    return _default_cache
@@ -1,10 +1,42 @@
 import re
-import pdfplumber
 import pandas as pd
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Iterator, NamedTuple, Any
+from modules.utils import iter_page_texts
+from modules.layouts import TABLE_LAYOUTS
+
+class InvoiceItem(NamedTuple):
+    """
+    One parsed invoice line. Numbers are kept as printed on the invoice (German format).
+    """
+    ls_nr: Optional[str]
+    art_nr: str
+    description: str
+    qty: str
+    unit: str
+    price_single: str
+    price_total: str
+    page: int
+    original_line: Optional[str] = None
+
+    def to_row(self) -> Dict[str, Any]:
+        """
+        Row in the column layout of parse_pdf.
+        """
+        row = {
+            "Rechnung LS-Nr": self.ls_nr,
+            "Artikel-Nr": self.art_nr,
+            "Bezeichnung": self.description,
+            "Menge": self.qty,
+            "Einheit": self.unit,
+            "Preis_Einzel": self.price_single,
+            "Preis_Gesamt": self.price_total,
+        }
+        if self.original_line is not None:
+            row["Original_Zeile"] = self.original_line
+        return row
 
 class InvoiceParser:
-    def __init__(self):
+    def __init__(self, workers: Optional[int] = None, supplier: str = "Kammerer", crop_to_table: bool = True):
         # Regex for finding the Delivery Note Number (Lieferschein-Nr)
         # Pattern looks for "Lfsch-/Rechn-Nr." followed by numbers
         self.ls_pattern = re.compile(r'Lfsch-/Rechn-Nr\.\s*:\s*(\d+)', re.IGNORECASE)
@@ -21,71 +53,124 @@ class InvoiceParser:
         # Also matches lines with JUST the number: "2092982"
         self.simple_item_start = re.compile(r'^(\d{6,})')
 
+        # Regex to parse the end of the line: Quantity+Unit Price Total [Marker]
+        # Example: "10 Fla 9,70 97,00 1" -> 10, Fla, 9,70, 97,00
+        self.end_pattern = re.compile(r'\s+(\d+)\s*([A-Za-z]+)\s+([\d,.]+)\s+([\d,.]+)(\d)?$', re.IGNORECASE)
+
+        # All of the above fused into one pattern, so a page is classified in a
+        # single finditer pass (lines that are neither LS header nor item are
+        # skipped inside the regex engine). Per line, same results as the chain
+        # strip -> ls_pattern.search -> simple_item_start.match -> end_pattern.search:
+        # ls: LS header | art + desc/qty/unit/ps/pt: item with details | art + rest: item without
+        self.line_pattern = re.compile(r"""
+            ^[^\S\n]*
+            (?:
+                [^\n]*?Lfsch-/Rechn-Nr\.[^\S\n]*:[^\S\n]*(?P<ls>\d+)
+              | (?P<line>
+                    (?=(?P<art>\d{6,}))(?P=art)
+                    (?:
+                        [^\S\n]*(?P<desc>\S[^\n]*?)
+                        [^\S\n]+(?P<qty>\d+)[^\S\n]*(?P<unit>[A-Za-z]+)
+                        [^\S\n]+(?P<ps>[\d,.]+)[^\S\n]+(?P<pt>[\d,.]+)\d?
+                      | (?:[^\S\n]*(?P<rest>\S[^\n]*?))?
+                    )
+                )[^\S\n]*$
+            )""", re.IGNORECASE | re.MULTILINE | re.VERBOSE)
+
+        # Worker processes for page extraction (None = AUDIT_EXTRACT_WORKERS / all cores, 1 = serial)
+        self.workers = workers
+        # Extract only the item table of the pages: the pinned layout of the
+        # supplier, else a region learned per document (False = whole pages).
+        # The gain depends on the layout, see TableLayout.extract.
+        self.supplier = supplier
+        self.crop_to_table = crop_to_table
+
     def parse_pdf(self, file_path_or_obj) -> pd.DataFrame:
         """
         Parses the Kammerer Invoice PDF and returns a structured DataFrame.
         """
-        extracted_data = []
+        return pd.DataFrame([item.to_row() for item in self.iter_items(file_path_or_obj, keep_original_line=True)])
+
+    def iter_items(self, file_path_or_obj, keep_original_line: bool = False) -> Iterator[InvoiceItem]:
+        """
+        Yields the invoice line items page by page.
+        Only one page of text is held at a time, so memory stays flat regardless
+        of the invoice length. The raw line is dropped unless keep_original_line is set.
+        """
         current_ls_nr = "UNKNOWN"
-        
-        # Regex to parse the end of the line: Quantity+Unit Price Total [Marker]
-        # Example: "10 Fla 9,70 97,00 1" -> 10, Fla, 9,70, 97,00
-        # ... (rest of comments)
-        end_pattern = re.compile(r'\s+(\d+)\s*([A-Za-z]+)\s+([\d,.]+)\s+([\d,.]+)(\d)?$', re.IGNORECASE)
-
-        with pdfplumber.open(file_path_or_obj) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text()
-                if not text:
-                    continue
-                
-                lines = text.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    
-                    # 1. Check for LS-Nr Header
-                    ls_match = self.ls_pattern.search(line)
-                    if ls_match:
-                        current_ls_nr = ls_match.group(1)
-                        continue
-                    
-                    # 2. Check for Item Line
-                    match = self.simple_item_start.match(line)
-                    if match:
-                        art_nr = match.group(1)
-                        # Remove ArtNr from line
-                        rest = line[len(art_nr):].strip()
-                        
-                        # Default values
-                        qty, unit, price_single, price_total = "0", "-", "0,00", "0,00"
-                        description = rest if rest else "(Keine Bezeichnung)"
-
-                        # Only try to parse details if there is text remaining
-                        if rest:
-                            # Parse details from the end
-                            details_match = end_pattern.search(rest)
-                            
-                            if details_match:
-                                qty = details_match.group(1).replace('.', '')
-                                unit = details_match.group(2)
-                                price_single = details_match.group(3)
-                                price_total = details_match.group(4)
-                                description = rest[:details_match.start()].strip()
-                        
-                        item_entry = {
-                            "Rechnung LS-Nr": current_ls_nr,
-                            "Artikel-Nr": art_nr,
-                            "Bezeichnung": description,
-                            "Menge": qty,
-                            "Einheit": unit,
-                            "Preis_Einzel": price_single,
-                            "Preis_Gesamt": price_total,
-                            "Original_Zeile": line
-                        }
-                        
-                        extracted_data.append(item_entry)
-                        
-        return pd.DataFrame(extracted_data)
+
+        # Page texts come from the shared page cache; uncached pages of large
+        # invoices are extracted in parallel (see iter_page_texts).
+        for page_no, text in enumerate(self._page_texts(file_path_or_obj), start=1):
+            items, last_ls_nr = self.parse_page_text(text, page=page_no, keep_original_line=keep_original_line)
+            # Items above the first LS header of a page belong to the delivery
+            # note continued from the previous page.
+            for item in items:
+                if item.ls_nr is None:
+                    item = item._replace(ls_nr=current_ls_nr)
+                yield item
+            if last_ls_nr:
+                current_ls_nr = last_ls_nr
+
+    def _page_texts(self, file_path_or_obj) -> Iterator[str]:
+        if not self.crop_to_table:
+            return iter_page_texts(file_path_or_obj, workers=self.workers)
+        return iter_page_texts(file_path_or_obj, workers=self.workers,
+                               layout=TABLE_LAYOUTS.get(self.supplier), table_pattern=self.line_pattern)
+
+    def iter_dataframes(self, file_path_or_obj, chunk_size: int = 5000, keep_original_line: bool = False) -> Iterator[pd.DataFrame]:
+        """
+        Yields the parsed items as DataFrames of at most chunk_size rows (same columns as parse_pdf).
+        """
+        rows = []
+        for item in self.iter_items(file_path_or_obj, keep_original_line=keep_original_line):
+            rows.append(item.to_row())
+            if len(rows) >= chunk_size:
+                yield pd.DataFrame(rows)
+                rows = []
+        if rows:
+            yield pd.DataFrame(rows)
+
+    def parse_page_text(self, text: str, page: int = 0, keep_original_line: bool = True) -> Tuple[List[InvoiceItem], Optional[str]]:
+        """
+        Parses the item lines of a single page.
+        Independent of the other pages, so pages can be parsed in any order:
+        items before the first LS header on the page get None as LS-Nr and the
+        last LS-Nr seen on the page is returned for the caller to carry forward.
+        """
+        extracted_data = []
+        current_ls_nr = None
+        if not text:
+            return extracted_data, current_ls_nr
+
+        for match in self.line_pattern.finditer(text):
+            ls_nr = match.group('ls')
+            if ls_nr is not None:
+                current_ls_nr = ls_nr
+                continue
+
+            if match.group('desc') is not None:
+                qty = match.group('qty').replace('.', '')
+                unit, price_single, price_total = match.group('unit', 'ps', 'pt')
+                description = match.group('desc')
+            else:
+                # No details found: keep the rest of the line as description
+                qty, unit, price_single, price_total = "0", "-", "0,00", "0,00"
+                description = match.group('rest') or "(Keine Bezeichnung)"
+
+            extracted_data.append(InvoiceItem(
+                ls_nr=current_ls_nr,
+                art_nr=match.group('art'),
+                description=description,
+                qty=qty,
+                unit=unit,
+                price_single=price_single,
+                price_total=price_total,
+                page=page,
+                original_line=match.group('line') if keep_original_line else None
+            ))
+
+        return extracted_data, current_ls_nr
 
     def extract_ls_numbers_from_text(self, text: str) -> set:
         """
@@ -96,10 +181,11 @@ class InvoiceParser:
 
 # Test run
 if __name__ == "__main__":
-    test_path = '/Users/ozan/Documents/Documents/Strategy/BR1/Rechnung_0401_5007287.pdf'
+    # python -m modules.parser Rechnung.pdf [ausgabe.csv]
+    import sys
     parser = InvoiceParser()
-    df = parser.parse_pdf(test_path)
+    df = parser.parse_pdf(sys.argv[1])
     print(f"Extracted {len(df)} items.")
     print(df.head().to_string())
-    # Save for inspection
-    df.to_csv('/Users/ozan/Documents/Documents/Strategy/BR1/parsed_invoice.csv', index=False, sep=';')
+    if len(sys.argv) > 2:
+        df.to_csv(sys.argv[2], index=False, sep=';')
@@ -1,40 +1,104 @@
 from fpdf import FPDF
 import pandas as pd
+import numpy as np
+import io
 import os
 from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+# Characters latin-1 cannot encode, replaced before encoding
+TRANSLATION = str.maketrans({
+    '€': 'EUR',
+    '–': '-',  # En-dash
+    '’': "'",
+    '“': '"',
+    '”': '"',
+})
+
+WRITE_CHUNK_CHARS = 1024 * 1024
 
 def sanitize(text):
     if not isinstance(text, str):
         text = str(text)
-    # Replace common issues
-    text = text.replace('€', 'EUR')
-    text = text.replace('–', '-') # En-dash
-    text = text.replace('’', "'")
-    text = text.replace('“', '"').replace('”', '"')
-    
-    # Encode to latin-1, replacing errors with '?'
-    return text.encode('latin-1', 'replace').decode('latin-1')
+    # Replace common issues, then encode to latin-1, replacing errors with '?'
+    return text.translate(TRANSLATION).encode('latin-1', 'replace').decode('latin-1')
+
+
+def sanitize_column(values: pd.Series, max_len: Optional[int] = None) -> List[str]:
+    """
+    Column-wise sanitize(): truncation and sanitizing run once per distinct
+    value, which for invoice columns (units, prices, status) is a small set.
+    """
+    text = values.astype(str)
+    if max_len is not None:
+        text = text.str.slice(0, max_len)
+    uniques = pd.unique(text)
+    mapping = dict(zip(uniques, (sanitize(u) for u in uniques)))
+    return [mapping[t] for t in text]
+
+
+@lru_cache(maxsize=None)
+def _logo_path() -> Optional[str]:
+    # Try to find the PNG logo
+    logo_path = "assets/breer_logo_dark.png"
+    if not os.path.exists(logo_path):
+        logo_path = os.path.join(os.path.dirname(__file__), "../assets/logo_blue.png")
+    return logo_path if os.path.exists(logo_path) else None
+
+
+@lru_cache(maxsize=None)
+def _parsed_logo(logo_path: str) -> Dict:
+    # Parsing the PNG (alpha channel separation) is by far the most expensive part
+    # of a small report; parse it once per process and hand each document a copy.
+    return FPDF()._parsepng(logo_path)
+
+
+class _PDFBuffer:
+    """
+    Stand-in for FPDF's document buffer: FPDF only appends to it and takes its
+    length for object offsets, so the parts are kept in a list instead of being
+    copied into one ever growing string on every append.
+    This (like _out and _parsepng below) relies on fpdf 1.7 internals; the
+    version is pinned in requirements.txt.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.length = 0
+
+    def __iadd__(self, text: str) -> "_PDFBuffer":
+        self.parts.append(text)
+        self.length += len(text)
+        return self
+
+    def __len__(self) -> int:
+        return self.length
 
 
 class AuditPDF(FPDF):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buffer = _PDFBuffer()
+
     def header(self):
         # Logo Logic
-        # Try to find the PNG logo
-        logo_path = "assets/breer_logo_dark.png"
-        if not os.path.exists(logo_path):
-             logo_path = os.path.join(os.path.dirname(__file__), "../assets/logo_blue.png")
-        
-        if os.path.exists(logo_path):
+        logo_path = _logo_path()
+        if logo_path:
+            if logo_path not in self.images:
+                info = dict(_parsed_logo(logo_path))
+                info['i'] = len(self.images) + 1
+                self.images[logo_path] = info
             # Image(path, x, y, w)
             self.image(logo_path, 10, 8, 40)
             self.ln(15) # Move cursor down after logo
-        
+
         # Header Text (Title)
         self.set_font('Arial', 'B', 15)
         self.set_text_color(30, 61, 89)
         # Move Title to the right if logo exists, or center/left
         self.cell(0, 10, 'BREER AUDIT REPORT', 0, 1, 'R') # Right aligned title
-        
+
         self.set_font('Arial', 'I', 10)
         self.set_text_color(100, 100, 100)
         self.cell(0, 10, f'Erstellt am: {datetime.now().strftime("%d.%m.%Y %H:%M")}', 0, 1, 'R')
@@ -46,7 +110,85 @@ class AuditPDF(FPDF):
         self.set_text_color(128)
         self.cell(0, 10, f'Seite {self.page_no()}', 0, 0, 'C')
 
-def generate_audit_pdf(df_results, total_loss):
+    def table_header(self, widths: List[float], headers: List[str]) -> None:
+        self.set_font("Arial", "B", 8)
+        self.set_fill_color(240, 240, 240)
+        for width, header in zip(widths, headers):
+            self.cell(width, 7, header, 1, 0, 'C', True)
+        self.ln()
+        self.set_font("Arial", "", 8)
+
+    def table_rows(self, widths: List[float], aligns: List[str], columns: List[List[str]],
+                   colors: List[str], widths_cache: Dict[str, float], h: float = 6) -> None:
+        """
+        Bordered table rows written straight into the page content: the same
+        operators cell() emits, but one page write per page and text widths
+        looked up once per distinct value. colors holds the PDF text color
+        operator per row (e.g. "0.784 0.000 0.000 rg").
+        """
+        k = self.k
+        cw = self.current_font['cw']
+        font_size = self.font_size
+        c_margin = self.c_margin
+        color_flag = self.fill_color != self.text_color
+        page_rows: List[str] = []
+        for row_idx, color in enumerate(colors):
+            if self.y + h > self.page_break_trigger and self.accept_page_break():
+                self._out('\n'.join(page_rows))
+                page_rows = []
+                self.add_page(self.cur_orientation)
+            x = self.l_margin
+            top = (self.h - self.y) * k
+            text_y = (self.h - (self.y + .5 * h + .3 * font_size)) * k
+            parts = []
+            for width, align, column in zip(widths, aligns, columns):
+                txt = column[row_idx]
+                cell = '%.2f %.2f %.2f %.2f re S ' % (x * k, top, width * k, -h * k)
+                if txt:
+                    if align == 'R':
+                        text_width = widths_cache.get(txt)
+                        if text_width is None:
+                            text_width = widths_cache[txt] = sum(cw.get(c, 0) for c in txt) * font_size / 1000.0
+                        dx = width - c_margin - text_width
+                    else:
+                        dx = c_margin
+                    text = 'BT %.2f %.2f Td (%s) Tj ET' % ((x + dx) * k, text_y, self._escape(txt))
+                    cell += 'q ' + color + ' ' + text + ' Q' if color_flag else text
+                parts.append(cell)
+                x += width
+            page_rows.append('\n'.join(parts))
+            self.y += h
+        if page_rows:
+            self._out('\n'.join(page_rows))
+        self.x = self.l_margin
+        # Keep FPDF's own color state consistent with what was written last
+        if colors:
+            self.text_color = colors[-1]
+            self.color_flag = self.fill_color != self.text_color
+
+
+def _status_colors(status: pd.Series) -> List[str]:
+    """
+    Text color per row: red for lines not delivered, orange for warnings, black otherwise.
+    """
+    status = status.astype(str)
+    red = status.str.contains("NICHT", regex=False).to_numpy()
+    orange = status.str.contains("ACHTUNG", regex=False).to_numpy()
+    colors = np.where(red, "0.784 0.000 0.000 rg", np.where(orange, "0.784 0.392 0.000 rg", "0.000 g"))
+    return colors.tolist()
+
+
+def _exception_mask(df: pd.DataFrame) -> np.ndarray:
+    if "Status" in df:
+        return df["Status"].to_numpy() != 0
+    return ~df["Handlung"].astype(str).str.contains("OK", regex=False).to_numpy()
+
+
+def build_audit_pdf(df_results, total_loss, exceptions_only: bool = False) -> AuditPDF:
+    """
+    Lays out the report. With exceptions_only the table is an appendix of the
+    deviating lines only (the summary still counts all lines).
+    """
     pdf = AuditPDF()
     pdf.add_page()
     pdf.set_auto_page_break(auto=True, margin=15)
@@ -55,13 +197,13 @@ def generate_audit_pdf(df_results, total_loss):
     pdf.set_font("Arial", "B", 12)
     pdf.set_text_color(0, 0, 0)
     pdf.cell(0, 10, "Zusammenfassung der Prüfung", 0, 1)
-    
+
     pdf.set_font("Arial", "", 10)
     total_items = len(df_results)
-    missing_items = len(df_results[df_results['Handlung'].str.contains("NICHT GELIEFERT", na=False)])
-    
+    missing_items = int(df_results['Handlung'].astype(str).str.contains("NICHT GELIEFERT", regex=False).sum())
+
     pdf.cell(0, 7, f"Geprüfte Positionen: {total_items}", 0, 1)
-    
+
     # Highlight Loss
     pdf.set_text_color(200, 0, 0) # Red
     pdf.set_font("Arial", "B", 10)
@@ -70,45 +212,50 @@ def generate_audit_pdf(df_results, total_loss):
     pdf.set_text_color(0) # Reset
     pdf.ln(10)
 
-    # --- TABLE HEADER ---
-    pdf.set_font("Arial", "B", 8)
-    pdf.set_fill_color(240, 240, 240)
-    
+    rows = df_results
+    if exceptions_only:
+        rows = df_results[_exception_mask(df_results)]
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(0, 10, f"Anhang: Abweichungen ({len(rows)} von {total_items} Positionen)", 0, 1)
+
+    # --- TABLE ---
     # Columns: Artikel, Bez, Menge, Preis, Status
-    # Widths
     w = [25, 60, 20, 25, 60]
     headers = ["Art-Nr", "Bezeichnung", "Menge", "Preis", "Status"]
-    
-    for i, h in enumerate(headers):
-        pdf.cell(w[i], 7, h, 1, 0, 'C', True)
-    pdf.ln()
-
-    # --- TABLE ROWS ---
-    pdf.set_font("Arial", "", 8)
-    
-    for index, row in df_results.iterrows():
-        # Status Color
-        status = str(row['Handlung'])
-        if "NICHT" in status:
-            pdf.set_text_color(200, 0, 0) # Red
-        elif "ACHTUNG" in status:
-            pdf.set_text_color(200, 100, 0) # Orange
-        else:
-            pdf.set_text_color(0) # Black
-
-        # Data
-        art = sanitize(str(row.get('Artikel-Nr', ''))[:12])
-        bez = sanitize(str(row.get('Bezeichnung', ''))[:35])
-        menge = sanitize(str(row.get('Menge', '')))
-        preis = sanitize(str(row.get('Preis_Gesamt', '')))
-        
-        pdf.cell(w[0], 6, art, 1)
-        pdf.cell(w[1], 6, bez, 1)
-        pdf.cell(w[2], 6, menge, 1, 0, 'R')
-        pdf.cell(w[3], 6, preis, 1, 0, 'R')
-        pdf.cell(w[4], 6, sanitize(status[:40]), 1)
-        pdf.ln()
-
-    # Output
-    # Return as string (latin-1) for Streamlit download button
-    return pdf.output(dest='S').encode('latin-1', 'replace')
+    pdf.table_header(w, headers)
+
+    def column(name: str, max_len: Optional[int] = None) -> List[str]:
+        values = rows[name] if name in rows else pd.Series('', index=rows.index)
+        return sanitize_column(values, max_len)
+
+    columns = [column('Artikel-Nr', 12), column('Bezeichnung', 35), column('Menge'),
+               column('Preis_Gesamt'), column('Handlung', 40)]
+    pdf.table_rows(w, ['L', 'L', 'R', 'R', 'L'], columns, _status_colors(rows['Handlung']), {})
+    return pdf
+
+
+def write_audit_pdf(df_results, total_loss, out, exceptions_only: bool = False) -> None:
+    """
+    Writes the report to a binary file object in chunks (no full copy of the
+    document as one string). fpdf 1.7 still builds the complete document in
+    memory first, so this bounds the copies made for the output, not the
+    memory of building the report.
+    """
+    pdf = build_audit_pdf(df_results, total_loss, exceptions_only)
+    pdf.close()
+    chunk: List[str] = []
+    size = 0
+    for part in pdf.buffer.parts:
+        chunk.append(part)
+        size += len(part)
+        if size >= WRITE_CHUNK_CHARS:
+            out.write(''.join(chunk).encode('latin-1', 'replace'))
+            chunk, size = [], 0
+    out.write(''.join(chunk).encode('latin-1', 'replace'))
+
+
+def generate_audit_pdf(df_results, total_loss, exceptions_only: bool = False):
+    # Return as bytes for Streamlit download button
+    out = io.BytesIO()
+    write_audit_pdf(df_results, total_loss, out, exceptions_only)
+    return out.getvalue()
@@ -0,0 +1,320 @@
+import os
+import copy
+import logging
+import datetime
+import pandas as pd
+from pathlib import Path
+from functools import lru_cache
+from typing import Any, Callable, List, Optional, Sequence
+
+from modules.utils import extract_text_from_pdf
+from modules import tracing
+
+# How the KI review runs its batches: "threads" (thread pool) or "async" (rate-limited async client)
+LLM_MODE = os.getenv("AUDIT_LLM_MODE", "threads")
+
+
+logger = logging.getLogger("audit.pipeline")
+
+
+def _log(message: str) -> None:
+    # Default for callers without their own log (the app and jobs pass one)
+    logger.info(message)
+
+
+@lru_cache(maxsize=None)
+def azure_client(api_version: str = "2024-08-01-preview"):
+    """
+    AzureOpenAI client shared by all audits of this process (created once, keeps its
+    connection pool). Only the sync client is shared; async clients are bound to the
+    event loop of one audit.
+    """
+    from openai import AzureOpenAI
+    return AzureOpenAI(
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=api_version,
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
+    )
+
+
+def ai_extract_prices(file_stream, bypass_cache: bool = False) -> pd.Series:
+    """
+    Extracts all prices of a PDF price list (full text, chunked and in parallel).
+    Raises IncompleteExtraction if some chunks failed.
+    """
+    from modules.price_extraction import extract_prices_chunked, IncompleteExtraction
+    from modules.price_catalog import prices_from_items
+    result = extract_prices_chunked(azure_client(), extract_text_from_pdf(file_stream), model="gpt-5.2-chat",
+                                    bypass_cache=bypass_cache)
+    prices = prices_from_items(result.items)
+    if not result.complete:
+        raise IncompleteExtraction(prices, result)
+    return prices
+
+
+def _file_name(file) -> str:
+    return getattr(file, "name", None) or Path(os.fspath(file)).name
+
+
+ROLE_LABELS = {"invoice": "Rechnung", "delivery": "Lieferschein", "prices": "Preisliste"}
+
+
+def _parse_invoice(invoice, supplier: str, workers: Optional[int] = None) -> pd.DataFrame:
+    from modules.parser import InvoiceParser
+    return InvoiceParser(workers=workers, supplier=supplier).parse_pdf(invoice)
+
+
+def _compile_price_file(f, supplier: str, valid_from: Optional[datetime.date], bypass_cache: bool,
+                        log: Callable[[str], None], workers: Optional[int] = None) -> Optional[pd.Series]:
+    """
+    Compiles one price list into the catalog and returns its prices; a partly
+    read PDF list is returned for this run but not stored. None on errors.
+    """
+    from modules.price_catalog import get_price_catalog, load_excel_prices
+    from modules.price_extraction import IncompleteExtraction
+    catalog = get_price_catalog()
+    name = _file_name(f)
+    try:
+        with tracing.span("price_list", file=name):
+            if name.endswith(".xlsx"):
+                extract = load_excel_prices
+            else:
+                def extract(file_stream):
+                    return ai_extract_prices(file_stream, bypass_cache)
+            return catalog.load(catalog.compile(f, supplier, valid_from, extract, name=name))
+    except IncompleteExtraction as e:
+        # Use what was found for this run, but do not store the list as complete
+        log(f"⚠️ Preisliste {name} unvollständig gelesen ({e}): {len(e.prices)} Preise übernommen.")
+        return e.prices
+    except Exception as e:
+        log(f"⚠️ Fehler bei Preisliste {name}: {e}")
+        return None
+
+
+def _ingest(invoice, delivery_files: Sequence[Any], price_files: Sequence[Any], supplier: str,
+            valid_from: Optional[datetime.date], bypass_cache: bool, log: Callable[[str], None],
+            progress: Optional[Callable[[float], None]]):
+    """
+    Reads invoice, delivery notes and price lists side by side (modules.ingest):
+    PDF parsing in processes, the LLM price extraction in threads; each finished
+    file is reported in the log and as progress.
+    Returns (invoice lines or None, delivery note texts, merged prices or None);
+    later price lists win for the articles they contain.
+    """
+    from modules.ingest import IngestTask, run_pipelined
+    tasks = []
+    if invoice is not None:
+        tasks.append(IngestTask("invoice", _file_name(invoice), _parse_invoice, (invoice, supplier)))
+    tasks += [IngestTask("delivery", _file_name(f), extract_text_from_pdf, (f,)) for f in delivery_files]
+    tasks += [IngestTask("prices", _file_name(f), _compile_price_file, (f, supplier, valid_from, bypass_cache, log),
+                         cpu=False) for f in price_files]
+    done = 0
+
+    def on_done(task, seconds: float, error: Optional[BaseException]) -> None:
+        nonlocal done
+        done += 1
+        tracing.record(f"ingest.{task.role}", seconds, file=task.name, **({"error": str(error)} if error else {}))
+        log(f"{'❌' if error else '✅'} {ROLE_LABELS[task.role]} {task.name} "
+            f"{'fehlgeschlagen' if error else 'gelesen'} ({seconds:.1f} s)")
+        if progress:
+            progress(done / len(tasks))
+
+    # Uploaded file objects stay in this process; paths (job inputs) can go to worker processes
+    on_disk = all(isinstance(task.args[0], (str, os.PathLike)) for task in tasks if task.cpu)
+    with tracing.span("ingest", files=len(tasks)):
+        results = run_pipelined(tasks, workers=None if on_disk else 1, on_done=on_done)
+    invoice_lines, delivery_texts, price_lists = None, [], []
+    for task, result in zip(tasks, results):
+        if task.role == "invoice":
+            invoice_lines = result
+        elif task.role == "delivery":
+            delivery_texts.append(result)
+        elif result is not None:
+            price_lists.append(result)
+    price_db = None
+    if price_files:
+        price_db = pd.concat(price_lists) if price_lists else pd.Series(dtype=float)
+        price_db = price_db[~price_db.index.duplicated(keep="last")]
+    return invoice_lines, delivery_texts, price_db
+
+
+def _evaluate(df_invoice: pd.DataFrame, price_db: Optional[pd.Series], delivery_index, delivery_texts: List[str],
+              ai_review: bool, bypass_cache: bool, log: Callable[[str], None],
+              progress: Optional[Callable[[float], None]],
+              on_update: Optional[Callable[[pd.DataFrame], None]], llm_mode: str = LLM_MODE) -> pd.DataFrame:
+    """
+    Reconciles the invoice lines (all or a subset), with the hybrid KI review if requested.
+    """
+    if ai_review:
+        from modules.auditor import InvoiceAuditor, API_VERSION
+        auditor = InvoiceAuditor(os.getenv("AZURE_OPENAI_API_KEY"), os.getenv("AZURE_OPENAI_ENDPOINT"),
+                                 client=azure_client(API_VERSION))
+        # Rule verdicts show up right away; KI answers replace open lines batch by batch
+        result = auditor.analyze_hybrid(
+            df_invoice, price_db, delivery_index, delivery_note_text="\n".join(delivery_texts),
+            deployment_name=auditor.model,
+            progress_callback=(lambda done, total: progress(done / total)) if progress else None,
+            bypass_cache=bypass_cache,
+            mode=llm_mode,
+            on_update=on_update
+        )
+        log(f"🤖 {result['detailed_reasoning']}")
+        if result["unchecked"]:
+            log(f"⚠️ {result['unchecked']} Positionen wurden nicht von der KI geprüft (Batch fehlgeschlagen); "
+                f"für sie gilt das Ergebnis des Regelwerks.")
+        return result["lines"]
+    from modules.reconcile import reconcile
+    with tracing.span("reconcile", lines=len(df_invoice)):
+        return reconcile(df_invoice, price_db, delivery_index)
+
+
+def _check_history(result: pd.DataFrame, supplier: str, invoice_key: str,
+                   log: Callable[[str], None]) -> pd.DataFrame:
+    """
+    Flags double billing and price drift against the line history of the supplier.
+    An invoice without lines has nothing to check.
+    """
+    if result.empty:
+        return result
+    from modules.history import get_line_history
+    from modules.reconcile import DUPLICATE_BILLING, PRICE_DRIFT
+    with tracing.span("history_check", lines=len(result)) as span:
+        result = get_line_history().check(result, supplier, invoice_key)
+        status = result["Status"].to_numpy()
+        span["duplicates"] = int((status & DUPLICATE_BILLING).astype(bool).sum())
+        span["drift"] = int((status & PRICE_DRIFT).astype(bool).sum())
+    if span["duplicates"]:
+        log(f"🔁 {span['duplicates']} Positionen wurden bereits mit einer anderen Rechnung berechnet.")
+    if span["drift"]:
+        log(f"📈 {span['drift']} Positionen mit geändertem Preis ggü. der letzten Rechnung.")
+    return result
+
+
+def start_audit(invoice,
+                delivery_files: Sequence[Any] = (),
+                price_files: Sequence[Any] = (),
+                supplier: str = "Kammerer",
+                valid_from: Optional[datetime.date] = None,
+                use_stored_prices: bool = True,
+                ai_review: bool = False,
+                bypass_cache: bool = False,
+                log: Callable[[str], None] = _log,
+                progress: Optional[Callable[[float], None]] = None,
+                on_update: Optional[Callable[[pd.DataFrame], None]] = None,
+                llm_mode: str = LLM_MODE):
+    """
+    The complete audit of one invoice: read invoice, delivery notes and price
+    lists side by side (see _ingest), index the delivery notes, reconcile (or
+    the hybrid KI review), check against the line history and record the lines
+    there. Files can be paths or uploaded file objects.
+    log receives the step messages shown to the user, progress the fraction of
+    files read and then of the KI review, on_update intermediate results of the
+    KI review. llm_mode selects how the KI batches run (see LLM_MODE).
+    Returns an AuditState (result plus the inputs update_audit needs).
+    """
+    from modules.parser import InvoiceParser
+    from modules.incremental import AuditState
+    from modules.storage import content_hash
+    log(f"📥 Lese Rechnung, {len(delivery_files)} Lieferscheine und {len(price_files)} Preislisten parallel ein...")
+    df_invoice, delivery_texts, price_db = _ingest(invoice, delivery_files, price_files, supplier, valid_from,
+                                                   bypass_cache, log, progress)
+    delivery_index = None
+    if delivery_files:
+        from modules.delivery_index import DeliveryNoteIndex
+        with tracing.span("delivery_index", files=len(delivery_files)) as span:
+            delivery_index = DeliveryNoteIndex.from_texts(delivery_texts, InvoiceParser(supplier=supplier))
+            span["ls_numbers"] = len(delivery_index)
+    if not price_files and use_stored_prices:
+        from modules.price_catalog import get_price_catalog
+        with tracing.span("price_list", stored=supplier) as span:
+            price_db = get_price_catalog().prices_as_of(supplier)
+            span["prices"] = len(price_db)
+        if len(price_db):
+            log(f"💾 {len(price_db)} Preise aus gespeicherten Preislisten ({supplier})")
+    log("⚖️ Führe Abgleich durch...")
+    result = _evaluate(df_invoice, price_db, delivery_index, delivery_texts, ai_review, bypass_cache,
+                       log, progress, on_update, llm_mode)
+    invoice_key = content_hash(invoice)
+    result = _check_history(result, supplier, invoice_key, log)
+    if len(result):
+        from modules.history import get_line_history
+        with tracing.span("history_record", lines=len(result)):
+            get_line_history().record(supplier, invoice_key, _file_name(invoice), result)
+    return AuditState(df_invoice, result, delivery_index, delivery_texts, price_db,
+                      file_hashes=[content_hash(f) for f in [*delivery_files, *price_files]], supplier=supplier,
+                      invoice_key=invoice_key)
+
+
+def update_audit(state,
+                 delivery_files: Sequence[Any] = (),
+                 price_files: Sequence[Any] = (),
+                 valid_from: Optional[datetime.date] = None,
+                 ai_review: bool = False,
+                 bypass_cache: bool = False,
+                 log: Callable[[str], None] = _log,
+                 progress: Optional[Callable[[float], None]] = None,
+                 on_update: Optional[Callable[[pd.DataFrame], None]] = None,
+                 llm_mode: str = LLM_MODE):
+    """
+    Incremental re-audit of a finished audit (AuditState) with delivery notes or
+    price lists handed in later. Only the new documents are read and only the
+    invoice rows depending on their LS and article numbers are re-evaluated;
+    the rows are merged into the previous result. Files already part of the
+    audit are skipped. Returns the new AuditState.
+    """
+    from modules.delivery_index import DeliveryNoteIndex
+    from modules.incremental import AuditState, changed_prices, merge_rows
+    from modules.storage import content_hash
+    from modules.parser import InvoiceParser
+    hashes = set(state.file_hashes)
+    new_files = {"delivery": [], "prices": []}
+    for role, files in (("delivery", delivery_files), ("prices", price_files)):
+        for f in files:
+            file_hash = content_hash(f)
+            if file_hash in hashes:
+                log(f"↩️ {_file_name(f)} ist bereits Teil der Prüfung.")
+                continue
+            hashes.add(file_hash)
+            new_files[role].append(f)
+
+    delivery_index, delivery_texts = state.delivery_index, list(state.delivery_texts)
+    prices = state.prices
+    every_row = False
+    changed_ls: set = set()
+    changed_articles: set = set()
+    if new_files["delivery"] or new_files["prices"]:
+        log(f"📥 Lese {len(new_files['delivery'])} neue Lieferscheine und {len(new_files['prices'])} neue "
+            f"Preislisten parallel ein...")
+    _, new_texts, new_prices = _ingest(None, new_files["delivery"], new_files["prices"], state.supplier, valid_from,
+                                       bypass_cache, log, progress)
+    if new_texts:
+        if delivery_index is None:
+            # The first delivery notes enable the LS checks of every row
+            delivery_index = DeliveryNoteIndex(InvoiceParser(supplier=state.supplier))
+            every_row = True
+        else:
+            delivery_index = copy.deepcopy(delivery_index)
+        with tracing.span("delivery_index", files=len(new_texts), incremental=True) as span:
+            for text in new_texts:
+                delivery_texts.append(text)
+                changed_ls |= delivery_index.add_text(text)
+            span["ls_numbers"] = len(changed_ls)
+    if new_prices is not None:
+        changed_articles = changed_prices(prices, new_prices)
+        # Like in start_audit, a later list wins for the articles it contains
+        every_row |= not len(prices)
+        prices = pd.concat([prices, new_prices])
+        prices = prices[~prices.index.duplicated(keep="last")]
+
+    rows = state.invoice.index if every_row else state.affected_rows(changed_ls, changed_articles)
+    log(f"⚖️ Bewerte {len(rows)} von {len(state.invoice)} Positionen neu...")
+    result = state.result
+    if len(rows):
+        subset = state.invoice.loc[rows]
+        updated = _evaluate(subset, prices if len(prices) else None, delivery_index, delivery_texts, ai_review,
+                            bypass_cache, log, progress,
+                            (lambda part: on_update(merge_rows(state.result, part))) if on_update else None,
+                            llm_mode)
+        result = merge_rows(state.result, _check_history(updated, state.supplier, state.invoice_key, log))
+    return AuditState(state.invoice, result, delivery_index, delivery_texts, prices,
+                      file_hashes=hashes, supplier=state.supplier, invoice_key=state.invoice_key)
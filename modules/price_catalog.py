@@ -0,0 +1,185 @@
+import time
+import datetime
+import pandas as pd
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from modules.storage import connect, content_hash
+
+
+def _find_column(columns, keywords) -> Any:
+    matches = [c for c in columns if any(k in str(c).lower() for k in keywords)]
+    if not matches:
+        raise ValueError(f"Keine Spalte gefunden für: {', '.join(keywords)}")
+    return matches[0]
+
+
+def parse_price_column(values: pd.Series) -> pd.Series:
+    """
+    Converts a price column to floats. Numeric cells are taken as is, text cells in
+    German format ("1.234,56") are converted; everything else becomes NaN.
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(float)
+    text = values.astype(str).str.strip()
+    german = text.str.contains(",", regex=False)
+    text = text.where(~german, text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    return pd.to_numeric(text, errors="coerce")
+
+
+def parse_article_column(values: pd.Series) -> pd.Series:
+    """
+    Article numbers as strings. Excel stores them as floats if a column has gaps
+    (867130.0), which would not match the invoice's "867130".
+    """
+    if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+        values = values.astype("Int64")
+    return values.astype(str).str.strip()
+
+
+def load_excel_prices(file_stream) -> pd.Series:
+    """
+    Reads an Excel price list into a Series Artikel-Nr -> price, column-wise (no row iteration).
+    """
+    df_p = pd.read_excel(file_stream)
+    col_art = _find_column(df_p.columns, ("art", "nr"))
+    col_price = _find_column(df_p.columns, ("preis", "eur"))
+    prices = pd.Series(parse_price_column(df_p[col_price]).to_numpy(), index=parse_article_column(df_p[col_art]))
+    valid_art = prices.index.notna() & ~prices.index.isin(["", "nan", "None", "<NA>"])
+    prices = prices[prices.notna() & valid_art]
+    return prices[~prices.index.duplicated(keep="last")]
+
+
+def prices_from_items(items: Iterable[Dict[str, Any]]) -> pd.Series:
+    """
+    Converts LLM extracted items ({"id": ..., "price": ...}) to a Series Artikel-Nr -> price.
+    """
+    return pd.Series({str(i["id"]): float(i["price"]) for i in items}, dtype=float)
+
+
+class PriceCatalog:
+    """
+    Persistent store of compiled price lists.
+    Every uploaded list is compiled once into an indexed SQLite table keyed by
+    (file hash, supplier); re-uploading the same file loads the stored prices
+    instead of re-reading Excel or calling the LLM again. Several versions per
+    supplier are kept and resolved by their valid-from date.
+    """
+
+    def __init__(self, db_name: str = "price_catalog.sqlite"):
+        self.db_name = db_name
+        # Loaded lists stay in memory for the lifetime of the process
+        self._loaded: Dict[int, pd.Series] = {}
+        with connect(self.db_name) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS price_lists (
+                    list_id INTEGER PRIMARY KEY,
+                    file_hash TEXT NOT NULL,
+                    supplier TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    valid_from TEXT NOT NULL,
+                    item_count INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    UNIQUE (file_hash, supplier)
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_lists_supplier ON price_lists (supplier, valid_from)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS prices (
+                    list_id INTEGER NOT NULL,
+                    art_nr TEXT NOT NULL,
+                    price REAL NOT NULL,
+                    PRIMARY KEY (list_id, art_nr)
+                ) WITHOUT ROWID""")
+
+    def find(self, file_hash: str, supplier: str) -> Optional[int]:
+        with connect(self.db_name) as conn:
+            row = conn.execute(
+                "SELECT list_id FROM price_lists WHERE file_hash = ? AND supplier = ?", (file_hash, supplier)
+            ).fetchone()
+        return row[0] if row else None
+
+    def store(self, file_hash: str, supplier: str, name: str, valid_from: datetime.date, prices: pd.Series) -> int:
+        with connect(self.db_name) as conn:
+            cur = conn.execute(
+                "INSERT OR REPLACE INTO price_lists (file_hash, supplier, name, valid_from, item_count, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (file_hash, supplier, name, valid_from.isoformat(), len(prices), time.time()),
+            )
+            list_id = cur.lastrowid
+            conn.execute("DELETE FROM prices WHERE list_id NOT IN (SELECT list_id FROM price_lists)")
+            conn.executemany(
+                "INSERT OR REPLACE INTO prices (list_id, art_nr, price) VALUES (?, ?, ?)",
+                zip([list_id] * len(prices), prices.index.astype(str), prices.astype(float)),
+            )
+        self._loaded[list_id] = prices
+        return list_id
+
+    def set_valid_from(self, list_id: int, valid_from: datetime.date) -> None:
+        with connect(self.db_name) as conn:
+            conn.execute("UPDATE price_lists SET valid_from = ? WHERE list_id = ?", (valid_from.isoformat(), list_id))
+
+    def load(self, list_id: int) -> pd.Series:
+        if list_id not in self._loaded:
+            with connect(self.db_name) as conn:
+                df = pd.read_sql_query("SELECT art_nr, price FROM prices WHERE list_id = ?", conn, params=(list_id,))
+            self._loaded[list_id] = pd.Series(df["price"].to_numpy(), index=df["art_nr"].to_numpy(), dtype=float)
+        return self._loaded[list_id]
+
+    def compile(self, file_stream, supplier: str, valid_from: Optional[datetime.date],
+                extract: Callable[[Any], pd.Series], name: str = "") -> int:
+        """
+        Returns the list id for a price-list file, running extract(file_stream) only
+        if this file was never compiled for the supplier. Empty results are not stored,
+        so a failed extraction is retried on the next upload.
+        A new list is valid from valid_from (default: today); a known list keeps
+        its date unless valid_from is given explicitly.
+        """
+        file_hash = content_hash(file_stream)
+        list_id = self.find(file_hash, supplier)
+        if list_id is not None:
+            if valid_from is not None:
+                self.set_valid_from(list_id, valid_from)
+            return list_id
+        prices = extract(file_stream)
+        if prices.empty:
+            raise ValueError("Keine Preise erkannt")
+        return self.store(file_hash, supplier, name or getattr(file_stream, "name", ""),
+                          valid_from or datetime.date.today(), prices)
+
+    def versions(self, supplier: Optional[str] = None) -> pd.DataFrame:
+        query = "SELECT list_id, supplier, name, valid_from, item_count FROM price_lists"
+        params: tuple = ()
+        if supplier is not None:
+            query += " WHERE supplier = ?"
+            params = (supplier,)
+        with connect(self.db_name) as conn:
+            return pd.read_sql_query(query + " ORDER BY supplier, valid_from, list_id", conn, params=params)
+
+    def merged(self, list_ids: Iterable[int]) -> pd.Series:
+        """
+        Combines several lists; for articles in more than one list the latest valid one wins.
+        """
+        list_ids = list(list_ids)
+        if not list_ids:
+            return pd.Series(dtype=float)
+        versions = self.versions()
+        order = versions[versions["list_id"].isin(list_ids)]["list_id"].tolist()
+        merged = pd.concat([self.load(list_id) for list_id in order])
+        return merged[~merged.index.duplicated(keep="last")]
+
+    def prices_as_of(self, supplier: str, as_of: Optional[datetime.date] = None) -> pd.Series:
+        """
+        Prices of a supplier valid on a given date (default: today).
+        """
+        as_of = as_of or datetime.date.today()
+        versions = self.versions(supplier)
+        return self.merged(versions[versions["valid_from"] <= as_of.isoformat()]["list_id"])
+
+
+_default_catalog: Optional[PriceCatalog] = None
+
+
+def get_price_catalog() -> PriceCatalog:
+    global _default_catalog
+    if _default_catalog is None:
+        _default_catalog = PriceCatalog()
+    return _default_catalog
@@ -0,0 +1,126 @@
+import os
+import json
+import concurrent.futures
+import pandas as pd
+from typing import Any, Dict, List, Tuple
+
+from modules import tracing
+from modules.llm_cache import cached_chat_completion
+
+# Chunk size in characters (roughly what the old single call sent), overlap
+# between neighbouring chunks so rows cut at a boundary appear whole in one of them.
+CHUNK_CHARS = int(os.getenv("AUDIT_PRICE_CHUNK_CHARS", "3000"))
+CHUNK_OVERLAP = 300
+# Upper bound for chunk calls in flight; below it every chunk gets its own call
+MAX_PARALLEL_CALLS = int(os.getenv("AUDIT_PRICE_PARALLEL_CALLS", "16"))
+
+SYSTEM_PROMPT = "You are a data extractor. Extract article numbers and unit prices from text. Return ONLY valid JSON with key items (list of id/price objects)."
+
+
+class PriceExtractionResult:
+    """
+    Outcome of a chunked extraction: merged items plus the chunks that failed.
+    """
+
+    def __init__(self, items: List[Dict[str, Any]], chunk_count: int, failures: List[Tuple[int, str]], conflicts: int = 0):
+        self.items = items
+        self.chunk_count = chunk_count
+        # (chunk index, error message)
+        self.failures = failures
+        # Articles that appeared with different prices in different chunks (first one wins)
+        self.conflicts = conflicts
+
+    @property
+    def complete(self) -> bool:
+        return not self.failures
+
+
+class IncompleteExtraction(Exception):
+    """
+    Raised when some chunks failed. Carries the prices that were extracted, so they can be
+    used for the current run without being stored as if the list was complete.
+    """
+
+    def __init__(self, prices: pd.Series, result: PriceExtractionResult):
+        super().__init__(f"{len(result.failures)} von {result.chunk_count} Abschnitten fehlgeschlagen")
+        self.prices = prices
+        self.result = result
+
+
+def split_text(text: str, chunk_chars: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    Splits text into chunks of about chunk_chars at line boundaries.
+    Each chunk repeats the last lines (up to overlap characters) of the previous one.
+    """
+    chunks = []
+    current: List[str] = []
+    size = 0
+    for line in text.split("\n"):
+        if current and size + len(line) + 1 > chunk_chars:
+            chunks.append("\n".join(current))
+            tail: List[str] = []
+            tail_size = 0
+            for prev in reversed(current):
+                if tail_size + len(prev) + 1 > overlap:
+                    break
+                tail.insert(0, prev)
+                tail_size += len(prev) + 1
+            current, size = tail, tail_size
+        current.append(line)
+        size += len(line) + 1
+    if any(line.strip() for line in current):
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _extract_chunk(client, model: str, chunk: str, bypass_cache: bool = False, index: int = 0) -> List[Dict[str, Any]]:
+    with tracing.span("llm.price_chunk", chunk=index + 1, chars=len(chunk)):
+        return cached_chat_completion(
+            client,
+            model=model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": f"Extract from this pricelist: {chunk}"}
+            ],
+            parse=lambda content: json.loads(content).get("items", []),
+            bypass=bypass_cache,
+            response_format={"type": "json_object"}
+        )
+
+
+def extract_prices_chunked(client, text: str, model: str = "gpt-5.2-chat",
+                           chunk_chars: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP,
+                           max_workers: int = MAX_PARALLEL_CALLS, bypass_cache: bool = False) -> PriceExtractionResult:
+    """
+    Extracts prices from the full text of a price list.
+    The text is split into overlapping chunks which are sent concurrently, one call
+    per chunk up to max_workers in flight; the items are merged by article number
+    in chunk order.
+    Chunk responses go through the LLM response cache unless bypass_cache is set.
+    """
+    chunks = split_text(text, chunk_chars, overlap)
+    results: Dict[int, List[Dict[str, Any]]] = {}
+    failures: List[Tuple[int, str]] = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+        future_to_chunk = {executor.submit(tracing.bind(_extract_chunk), client, model, chunk, bypass_cache, idx): idx
+                           for idx, chunk in enumerate(chunks)}
+        for future in concurrent.futures.as_completed(future_to_chunk):
+            idx = future_to_chunk[future]
+            try:
+                results[idx] = future.result()
+            except Exception as exc:
+                failures.append((idx, str(exc)))
+
+    merged: Dict[str, Dict[str, Any]] = {}
+    conflicts = 0
+    for idx in sorted(results):
+        for item in results[idx]:
+            try:
+                art_nr, price = str(item["id"]).strip(), float(item["price"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if art_nr in merged:
+                conflicts += merged[art_nr]["price"] != price
+                continue
+            merged[art_nr] = {"id": art_nr, "price": price}
+    return PriceExtractionResult(list(merged.values()), len(chunks), sorted(failures), conflicts)
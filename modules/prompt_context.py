@@ -0,0 +1,143 @@
+import os
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from modules.parser import InvoiceParser
+from modules.delivery_index import DeliveryNoteIndex
+from modules.rate_limit import estimate_tokens
+
+# Input tokens per LLM call (invoice pages + relevant price rows + delivery notes)
+DEFAULT_INPUT_TOKEN_BUDGET = int(os.getenv("AUDIT_PROMPT_TOKEN_BUDGET", "24000"))
+# Each audited line comes back as one CSV row; keep the answer below the completion limit
+OUTPUT_TOKENS_PER_ITEM = 40
+# System prompt, instructions and framing of the user message
+PROMPT_OVERHEAD_TOKENS = 700
+
+
+class PromptBatch(NamedTuple):
+    pages: List[str]
+    price_list_csv: str
+    delivery_note_text: str
+    estimated_tokens: int
+
+
+class PriceListRows:
+    """
+    The price-list CSV split into rows, indexed by the article numbers they contain.
+    """
+
+    # 6+ digit numbers that are not the decimal part of another number ("867130" or "867130.0")
+    article_pattern = re.compile(r'(?<![\d.,])(\d{6,})(?!\d)')
+
+    def __init__(self, price_list_csv: str):
+        lines = price_list_csv.splitlines() if price_list_csv else []
+        self.header = lines[0] if lines else ""
+        self.rows = lines[1:]
+        self.by_article: Dict[str, List[int]] = {}
+        for idx, row in enumerate(self.rows):
+            for art_nr in set(self.article_pattern.findall(row)):
+                self.by_article.setdefault(art_nr, []).append(idx)
+        self.row_tokens = [estimate_tokens(row) for row in self.rows]
+
+    def row_indices(self, articles: Iterable[str]) -> Set[int]:
+        indices: Set[int] = set()
+        for art_nr in articles:
+            indices.update(self.by_article.get(art_nr, ()))
+        return indices
+
+    def csv_for(self, articles: Iterable[str]) -> str:
+        indices = sorted(self.row_indices(articles))
+        return "\n".join([self.header] + [self.rows[i] for i in indices])
+
+
+class PromptContextBuilder:
+    """
+    Assembles the per-batch LLM context.
+    Each invoice page is pre-scanned with InvoiceParser's regexes for article and
+    LS numbers; a batch then only carries the price-list rows and delivery-note
+    sections for those numbers, and pages are grouped into batches by token
+    budget instead of a fixed page count.
+    """
+
+    def __init__(self, price_list_csv: str, delivery_note_text: str = "", parser: Optional[InvoiceParser] = None):
+        self.parser = parser or InvoiceParser()
+        self.price_rows = PriceListRows(price_list_csv)
+        self.delivery_index = DeliveryNoteIndex(self.parser, keep_sections=True)
+        self.delivery_index.add_text(delivery_note_text)
+        self._carry_ls_nr: Optional[str] = None
+        self.section_tokens = {ls_nr: estimate_tokens("\n".join(lines)) for ls_nr, lines in self.delivery_index.sections.items()}
+
+    def scan_page(self, page: str):
+        """
+        Article numbers, LS numbers and the number of item lines on a page.
+        Pages must be scanned in order (the current LS-Nr carries over page breaks).
+        """
+        articles: Set[str] = set()
+        ls_numbers: Set[str] = set()
+        item_count = 0
+        last_ls_nr = self._carry_ls_nr
+        for line in page.split('\n'):
+            line = line.strip()
+            ls_match = self.parser.ls_pattern.search(line)
+            if ls_match:
+                last_ls_nr = ls_match.group(1)
+                ls_numbers.add(last_ls_nr)
+                continue
+            match = self.parser.simple_item_start.match(line)
+            if match:
+                articles.add(match.group(1))
+                item_count += 1
+                # Items above the first header continue the previous page's delivery note
+                if last_ls_nr:
+                    ls_numbers.add(last_ls_nr)
+        self._carry_ls_nr = last_ls_nr
+        # LS numbers printed elsewhere on the page (e.g. in item lines of other layouts)
+        ls_numbers |= self.parser.extract_ls_numbers_from_text(page) & self.delivery_index.ls_numbers
+        return articles, ls_numbers, item_count
+
+    def build(self, pages: List[str], articles: Set[str], ls_numbers: Set[str]) -> PromptBatch:
+        price_csv = self.price_rows.csv_for(articles)
+        delivery_text = self.delivery_index.section_text(ls_numbers)
+        tokens = PROMPT_OVERHEAD_TOKENS + sum(estimate_tokens(p) for p in pages) + estimate_tokens(price_csv) + estimate_tokens(delivery_text)
+        return PromptBatch(pages, price_csv, delivery_text, tokens)
+
+    def plan(self, pages: List[str], token_budget: int = DEFAULT_INPUT_TOKEN_BUDGET,
+             max_output_tokens: int = 16000) -> List[PromptBatch]:
+        """
+        Groups consecutive pages into batches that stay within the input token budget
+        and whose expected answer fits into max_output_tokens. A single page that is
+        too large on its own still becomes its own batch.
+        """
+        max_items = max(1, int(max_output_tokens * 0.8) // OUTPUT_TOKENS_PER_ITEM)
+        self._carry_ls_nr = None
+        batches: List[PromptBatch] = []
+        batch_pages: List[str] = []
+        articles: Set[str] = set()
+        ls_numbers: Set[str] = set()
+        price_rows: Set[int] = set()
+        tokens = items = 0
+
+        for page in pages:
+            page_articles, page_ls, page_items = self.scan_page(page)
+            new_rows = self.price_rows.row_indices(page_articles - articles) - price_rows
+            added = (estimate_tokens(page)
+                     + sum(self.price_rows.row_tokens[i] for i in new_rows)
+                     + sum(self.section_tokens.get(ls_nr, 0) for ls_nr in page_ls - ls_numbers))
+            if batch_pages and (PROMPT_OVERHEAD_TOKENS + tokens + added > token_budget or items + page_items > max_items):
+                batches.append(self.build(batch_pages, articles, ls_numbers))
+                batch_pages, articles, ls_numbers, price_rows = [], set(), set(), set()
+                tokens = items = 0
+                new_rows = self.price_rows.row_indices(page_articles)
+                added = (estimate_tokens(page)
+                         + sum(self.price_rows.row_tokens[i] for i in new_rows)
+                         + sum(self.section_tokens.get(ls_nr, 0) for ls_nr in page_ls))
+            batch_pages.append(page)
+            articles |= page_articles
+            ls_numbers |= page_ls
+            price_rows |= new_rows
+            tokens += added
+            items += page_items
+
+        if batch_pages:
+            batches.append(self.build(batch_pages, articles, ls_numbers))
+        return batches
@@ -0,0 +1,116 @@
+import asyncio
+import random
+import time
+from typing import Optional
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token estimate (about 4 characters per token for German/English text).
+    """
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """
+    Async token bucket refilled continuously at rate_per_minute.
+    Used twice per deployment: once for requests (RPM), once for tokens (TPM).
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        # Requests larger than the bucket would wait forever; let them drain it instead
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def drain(self) -> None:
+        """
+        Empties the bucket, e.g. after a 429 told us the server-side quota is used up.
+        """
+        self._refill()
+        self.tokens = 0
+
+
+class AIMDConcurrency:
+    """
+    Adaptive concurrency limit (additive increase, multiplicative decrease):
+    every full window of successful calls raises the limit by one, every
+    throttled call halves it.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 32, decrease: float = 0.5):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.in_flight = 0
+        self._successes = 0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self) -> None:
+        self._successes += 1
+        if self._successes >= self.limit:
+            self._successes = 0
+            self.limit = min(self.maximum, self.limit + 1)
+
+    def on_throttle(self) -> None:
+        self._successes = 0
+        self.limit = max(self.minimum, int(self.limit * self.decrease))
+
+
+class RateLimiter:
+    """
+    Combines the RPM/TPM buckets of one deployment with the adaptive concurrency limit.
+    """
+
+    def __init__(self, rpm: float, tpm: float, initial_concurrency: int = 4, max_concurrency: int = 32):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AIMDConcurrency(initial=initial_concurrency, maximum=max_concurrency)
+
+    async def acquire(self, estimated_tokens: int) -> None:
+        await self.requests.acquire(1)
+        await self.tokens.acquire(estimated_tokens)
+
+    def on_throttle(self) -> None:
+        self.concurrency.on_throttle()
+        self.requests.drain()
+        self.tokens.drain()
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0, retry_after: Optional[float] = None) -> float:
+    """
+    Exponential backoff with full jitter; a server supplied Retry-After is the lower bound.
+    """
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Mapping, Optional, Union
+
+# Status flags (bitmask in the "Status" column). 0 means the line is OK.
+LS_MISSING = 1       # Invoice line without LS-Nr
+NO_DELIVERY = 2      # LS-Nr not found in any delivery note
+NOT_ON_NOTE = 4      # LS found, but the article is not on it
+QTY_ERROR = 8        # Invoiced quantity > delivered quantity
+PRICE_ERROR = 16     # Unit price deviates from the price list
+DUPLICATE_BILLING = 32  # LS-Nr + article already billed on another invoice (modules.history)
+PRICE_DRIFT = 64     # Unit price differs from the last billed one (modules.history)
+
+STATUS_LABELS = {
+    LS_MISSING: "⚠️ LS-Nr fehlt",
+    NO_DELIVERY: "❌ Kein Lieferschein",
+    NOT_ON_NOTE: "❌ Artikel fehlt auf Lieferschein",
+    QTY_ERROR: "❌ Mengenfehler",
+    PRICE_ERROR: "💸 Preisfehler",
+    DUPLICATE_BILLING: "🔁 Bereits berechnet",
+    PRICE_DRIFT: "📈 Preis geändert",
+}
+OK_LABEL = "✅ OK"
+
+PRICE_TOLERANCE = 0.05
+
+
+def parse_german_number(values: pd.Series, thousands: bool = True) -> pd.Series:
+    """
+    Converts German formatted numbers ("1.234,56") to floats in one pass.
+    Unparseable values become 0.0. With thousands=False a dot is kept as decimal point.
+    """
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(float).fillna(0.0)
+    text = values.astype(str)
+    if thousands:
+        text = text.str.replace(".", "", regex=False)
+    text = text.str.replace(",", ".", regex=False)
+    return pd.to_numeric(text, errors="coerce").fillna(0.0)
+
+
+def status_label(status: int) -> str:
+    if not status:
+        return OK_LABEL
+    return " | ".join(label for flag, label in STATUS_LABELS.items() if status & flag)
+
+
+def status_to_labels(status: pd.Series) -> pd.Series:
+    """
+    Maps the bitmask column to the human readable "Handlung" texts as a categorical
+    (each distinct combination is formatted only once).
+    """
+    codes = pd.Categorical(status)
+    return pd.Series(codes.rename_categories([status_label(int(c)) for c in codes.categories]), index=status.index)
+
+
+def status_counts(df: pd.DataFrame) -> Dict[str, int]:
+    """
+    Counts for the dashboard, computed from the bitmask instead of text searches.
+    """
+    status = df["Status"].to_numpy()
+    return {
+        "total": len(df),
+        "ok": int((status == 0).sum()),
+        "price": int((status & PRICE_ERROR).astype(bool).sum()),
+        "ls": int((status & NO_DELIVERY).astype(bool).sum()),
+        "delivery": int((status & (NOT_ON_NOTE | QTY_ERROR)).astype(bool).sum()),
+        "duplicate": int((status & DUPLICATE_BILLING).astype(bool).sum()),
+        "drift": int((status & PRICE_DRIFT).astype(bool).sum()),
+    }
+
+
+def resolved_mask(df: pd.DataFrame, has_prices: bool, has_delivery: bool) -> np.ndarray:
+    """
+    Lines the rule engine settles on its own: parsed lines that are clearly wrong
+    (not delivered, wrong quantity, wrong price) or clearly OK (every available
+    check ran and passed). Everything else is ambiguous and worth an LLM look:
+    unparsed lines, missing LS-Nr, articles without list price, delivery notes
+    whose items could not be read.
+    """
+    status = df["Status"].to_numpy()
+    parsed = (df["Einheit"] != "-").to_numpy() if "Einheit" in df else np.ones(len(df), dtype=bool)
+    price_checked = df["Listenpreis"].notna().to_numpy() if has_prices else True
+    delivery_checked = df["Menge Geliefert"].notna().to_numpy() if has_delivery and "Menge Geliefert" in df else True
+    clearly_wrong = ((status & (NO_DELIVERY | NOT_ON_NOTE | QTY_ERROR | PRICE_ERROR)) != 0) & ((status & LS_MISSING) == 0)
+    clearly_ok = (status == 0) & price_checked & delivery_checked
+    return parsed & (clearly_wrong | clearly_ok)
+
+
+def flags_from_audit_label(label: str) -> int:
+    """
+    Status flags for a "Handlung" text in the LLM auditor's vocabulary.
+    """
+    label = label.upper()
+    status = 0
+    if "NICHT GELIEFERT" in label:
+        status |= NO_DELIVERY
+    if "MENGENFEHLER" in label:
+        status |= QTY_ERROR
+    if "PREISFEHLER" in label:
+        status |= PRICE_ERROR
+    return status
+
+
+def reconcile(df_invoice: pd.DataFrame,
+              price_db: Optional[Union[Mapping[str, float], pd.Series]] = None,
+              delivery_index=None,
+              tolerance: float = PRICE_TOLERANCE) -> pd.DataFrame:
+    """
+    Matches parsed invoice lines against price list and delivery notes.
+    All checks are columnar: number parsing, unit price derivation, the price
+    list join and the delivery lookups run once per column, not once per row.
+
+    Returns the invoice columns plus "Status" (bitmask), "Handlung" (labels),
+    "Einzelpreis (Inv)", "Listenpreis" and, with delivery notes, "Menge Geliefert".
+    """
+    df = df_invoice.copy()
+    if df.empty:
+        # Same dtypes as a non-empty result, so the bitmask consumers work on it
+        df["Status"] = pd.Series(dtype=np.uint8)
+        df["Handlung"] = status_to_labels(df["Status"])
+        df["Einzelpreis (Inv)"] = pd.Series(dtype=float)
+        df["Listenpreis"] = pd.Series(dtype=float)
+        return df
+
+    art_nr = df.get("Artikel-Nr", pd.Series("", index=df.index)).astype(str)
+    ls_nr = df.get("Rechnung LS-Nr", pd.Series("", index=df.index)).fillna("").astype(str)
+    qty = parse_german_number(df.get("Menge", pd.Series(0, index=df.index)), thousands=False)
+    total_price = parse_german_number(df.get("Preis_Gesamt", pd.Series(0, index=df.index)))
+    unit_price = np.where(qty > 0, total_price / qty.where(qty > 0, 1.0), 0.0)
+
+    status = np.zeros(len(df), dtype=np.uint8)
+
+    if delivery_index is not None:
+        ls_missing = ((ls_nr == "") | (ls_nr == "UNKNOWN")).to_numpy()
+        ls_known = ls_nr.isin(delivery_index.ls_numbers).to_numpy()
+        status |= np.where(ls_missing, LS_MISSING, 0).astype(np.uint8)
+        status |= np.where(~ls_missing & ~ls_known, NO_DELIVERY, 0).astype(np.uint8)
+
+        # Join on (LS-Nr, Artikel-Nr); only notes whose items could be parsed say anything about articles
+        delivered_frame = delivery_index.delivered_frame()
+        keys = pd.MultiIndex.from_arrays([ls_nr, art_nr])
+        delivered = pd.Series(delivered_frame["Geliefert"].to_numpy(),
+                              index=pd.MultiIndex.from_frame(delivered_frame[["LS-Nr", "Artikel-Nr"]]))
+        delivered = np.nan_to_num(delivered.reindex(keys).to_numpy(dtype=float))
+        has_items = ls_known & ls_nr.isin(delivery_index.items.keys()).to_numpy()
+        status |= np.where(has_items & (delivered == 0), NOT_ON_NOTE, 0).astype(np.uint8)
+        status |= np.where(has_items & (delivered > 0) & (qty.to_numpy() > delivered), QTY_ERROR, 0).astype(np.uint8)
+        df["Menge Geliefert"] = np.where(has_items, delivered, np.nan)
+
+    list_price = pd.Series(np.nan, index=df.index)
+    if price_db is not None and len(price_db):
+        prices = price_db if isinstance(price_db, pd.Series) else pd.Series(price_db, dtype=float)
+        prices = prices.set_axis(prices.index.astype(str))
+        prices = prices[~prices.index.duplicated(keep="last")]
+        list_price = art_nr.map(prices)
+        price_error = list_price.notna().to_numpy() & (np.abs(unit_price - list_price.fillna(0).to_numpy()) > tolerance)
+        status |= np.where(price_error, PRICE_ERROR, 0).astype(np.uint8)
+
+    df["Status"] = status
+    df["Handlung"] = status_to_labels(df["Status"])
+    df["Einzelpreis (Inv)"] = unit_price
+    df["Listenpreis"] = list_price.where(list_price > 0)
+    return df
@@ -0,0 +1,95 @@
+import io
+import hashlib
+import threading
+import pandas as pd
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from modules.pdf_generator import generate_audit_pdf
+from modules import tracing
+
+# Built artifacts kept in memory (across sessions of this server process)
+MAX_CACHED_REPORTS = 12
+
+
+def result_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Content hash of a result set (values, index, column names and dtypes).
+    """
+    digest = hashlib.sha256()
+    digest.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def build_pdf(df: pd.DataFrame) -> bytes:
+    return generate_audit_pdf(df, 0.0)
+
+
+def build_pdf_exceptions(df: pd.DataFrame) -> bytes:
+    return generate_audit_pdf(df, 0.0, exceptions_only=True)
+
+
+def build_csv(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False, sep=";").encode("utf-8")
+
+
+def build_excel(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        df.to_excel(writer, index=False, sheet_name="Prüfergebnis")
+    return buffer.getvalue()
+
+
+REPORT_BUILDERS: Dict[str, Callable[[pd.DataFrame], bytes]] = {
+    "pdf": build_pdf,
+    "pdf_exceptions": build_pdf_exceptions,
+    "csv": build_csv,
+    "xlsx": build_excel,
+}
+
+
+class ReportCache:
+    """
+    Report artifacts memoized by (result fingerprint, format): each format of a
+    result set is built at most once, and only when it is first requested.
+    Thread-safe, since download callbacks run outside the script thread.
+    """
+
+    def __init__(self, max_entries: int = MAX_CACHED_REPORTS):
+        self.max_entries = max_entries
+        self._reports: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per artifact, so two clicks do not build the same report twice
+        self._building: Dict[Tuple[str, str], threading.Lock] = {}
+
+    def get(self, df: pd.DataFrame, kind: str, fingerprint: Optional[str] = None) -> bytes:
+        key = (fingerprint or result_fingerprint(df), kind)
+        with self._lock:
+            if key in self._reports:
+                self._reports.move_to_end(key)
+                return self._reports[key]
+            build_lock = self._building.setdefault(key, threading.Lock())
+        with build_lock:
+            with self._lock:
+                if key in self._reports:
+                    return self._reports[key]
+            with tracing.span("report", kind=kind, lines=len(df)) as span:
+                data = REPORT_BUILDERS[kind](df)
+                span["bytes"] = len(data)
+            with self._lock:
+                self._reports[key] = data
+                self._building.pop(key, None)
+                while len(self._reports) > self.max_entries:
+                    self._reports.popitem(last=False)
+        return data
+
+
+_default_cache: Optional[ReportCache] = None
+
+
+def get_report_cache() -> ReportCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ReportCache()
+    return _default_cache
@@ -0,0 +1,73 @@
+import os
+import shutil
+import hashlib
+import sqlite3
+from pathlib import Path
+from typing import Any
+
+# Everything the app persists between runs (caches, catalogs, job data) lives
+# below this directory. On Azure App Service point it at /home/... so it
+# survives restarts.
+DEFAULT_DATA_DIR = Path(__file__).resolve().parent.parent / ".audit_data"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Uploads are copied to disk in chunks of this size, never as one bytes object
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+def data_dir(*parts: str) -> Path:
+    """
+    Returns (and creates) a directory below the persistent data directory.
+    """
+    path = Path(os.getenv("AUDIT_DATA_DIR", str(DEFAULT_DATA_DIR))).joinpath(*parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def connect(db_name: str) -> sqlite3.Connection:
+    """
+    Opens a SQLite database in the data directory.
+    WAL mode lets Streamlit threads and worker processes read while one writes.
+    """
+    conn = sqlite3.connect(str(data_dir() / db_name), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def content_hash(file_path_or_obj: Any) -> str:
+    """
+    SHA-256 of a file path or file-like object (e.g. Streamlit UploadedFile).
+    File-like objects are rewound afterwards so they can be read again.
+    """
+    digest = hashlib.sha256()
+    if isinstance(file_path_or_obj, (str, os.PathLike)):
+        with open(file_path_or_obj, "rb") as fh:
+            for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    elif isinstance(file_path_or_obj, (bytes, bytearray, memoryview)):
+        digest.update(file_path_or_obj)
+    else:
+        file_path_or_obj.seek(0)
+        for chunk in iter(lambda: file_path_or_obj.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        file_path_or_obj.seek(0)
+    return digest.hexdigest()
+
+
+def spool_to(file_stream: Any, path: os.PathLike) -> Path:
+    """
+    Writes an upload (file-like object, bytes or a path) to path in chunks.
+    File-like objects are rewound before and after, so they can be read again.
+    """
+    path = Path(path)
+    if isinstance(file_stream, (bytes, bytearray, memoryview)):
+        path.write_bytes(file_stream)
+    elif isinstance(file_stream, (str, os.PathLike)):
+        shutil.copyfile(file_stream, path)
+    else:
+        file_stream.seek(0)
+        with open(path, "wb") as fh:
+            shutil.copyfileobj(file_stream, fh, SPOOL_CHUNK_SIZE)
+        file_stream.seek(0)
+    return path
@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Finished spans are logged as one JSON object per line (AUDIT_TRACE_LOG=0 disables)
+TRACE_LOG = os.getenv("AUDIT_TRACE_LOG", "1") != "0"
+# Log file for the JSON lines; stderr if unset
+TRACE_FILE = os.getenv("AUDIT_TRACE_FILE")
+# Optional LLM prices per 1M tokens (in the currency of the Azure bill) for the cost estimate
+COST_INPUT_1M = float(os.getenv("AUDIT_LLM_COST_INPUT_1M", "0"))
+COST_OUTPUT_1M = float(os.getenv("AUDIT_LLM_COST_OUTPUT_1M", "0"))
+
+# Numeric span attributes that are summed up per trace
+TOTAL_KEYS = ("llm_calls", "llm_cache_hits", "prompt_tokens", "completion_tokens", "retries", "throttled")
+
+logger = logging.getLogger("audit.trace")
+if TRACE_LOG and not logger.handlers:
+    _handler = logging.FileHandler(TRACE_FILE, encoding="utf-8") if TRACE_FILE else logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class Trace:
+    """
+    The finished spans of one run (e.g. the audit of one invoice).
+    Thread-safe, since LLM batches finish on pool threads.
+    """
+
+    def __init__(self, name: str, **attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started = time.time()
+        self.duration_ms: Optional[float] = None
+        self._spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._spans.append(record)
+
+    def records(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return sorted(self._spans, key=lambda r: r["start"])
+
+    def totals(self) -> Dict[str, Any]:
+        totals: Dict[str, Any] = {key: 0 for key in TOTAL_KEYS}
+        for record in self.records():
+            for key in TOTAL_KEYS:
+                totals[key] += record.get(key, 0)
+        if COST_INPUT_1M or COST_OUTPUT_1M:
+            totals["llm_cost"] = round((totals["prompt_tokens"] * COST_INPUT_1M
+                                        + totals["completion_tokens"] * COST_OUTPUT_1M) / 1e6, 4)
+        if self.duration_ms is not None:
+            totals["duration_ms"] = self.duration_ms
+        return totals
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"trace_id": self.trace_id, "name": self.name, "start": self.started, **self.attrs,
+                "totals": self.totals(), "spans": self.records()}
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("audit_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("audit_span", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def capture() -> Iterator[Trace]:
+    """
+    Collects the spans of the block in a trace of its own, without a summary
+    record: used in worker processes, which cannot reach the caller's trace
+    and hand their spans back with the result instead (see adopt).
+    """
+    run = Trace("capture")
+    trace_token = _current_trace.set(run)
+    span_token = _current_span.set(None)
+    try:
+        yield run
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+
+def adopt(records: List[Dict[str, Any]]) -> None:
+    """
+    Adds spans collected elsewhere (see capture) to the current trace; their
+    top-level spans become children of the current span. They were already
+    logged where they were recorded, so they are not logged again.
+    """
+    run = _current_trace.get()
+    if run is None:
+        return
+    parent = _current_span.get()
+    for record in records:
+        record = dict(record, trace_id=run.trace_id)
+        if record.get("parent_id") is None:
+            record["parent_id"] = parent["span_id"] if parent else None
+        run.add(record)
+
+
+@contextmanager
+def trace(name: str, **attrs) -> Iterator[Trace]:
+    """
+    Collects all spans opened in this context (and in work bound to it, see bind)
+    and logs a summary record with the totals at the end.
+    """
+    run = Trace(name, **attrs)
+    trace_token = _current_trace.set(run)
+    span_token = _current_span.set(None)
+    started = time.perf_counter()
+    try:
+        yield run
+    finally:
+        run.duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        _emit({"event": "trace", "trace_id": run.trace_id, "name": name, **attrs, **run.totals()})
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Dict[str, Any]]:
+    """
+    Times the block as a child of the current span. The yielded record can be
+    extended (see also annotate/count); an exception is recorded as "error".
+    Spans outside a trace are only logged.
+    """
+    parent = _current_span.get()
+    record = {"name": name, "span_id": uuid.uuid4().hex[:8],
+              "parent_id": parent["span_id"] if parent else None, "start": time.time(), **attrs}
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record.setdefault("error", str(e) or type(e).__name__)
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        _current_span.reset(token)
+        _finish(record)
+
+
+def record(name: str, duration_s: float, **attrs) -> None:
+    """
+    Adds a finished span measured by the caller, e.g. time spent inside a
+    generator (which must not hold a span open across its yields).
+    """
+    parent = _current_span.get()
+    _finish({"name": name, "span_id": uuid.uuid4().hex[:8], "parent_id": parent["span_id"] if parent else None,
+             "start": time.time() - duration_s, **attrs, "duration_ms": round(duration_s * 1000, 2)})
+
+
+def annotate(**attrs) -> None:
+    """
+    Sets attributes of the current span (no-op outside a span).
+    """
+    current = _current_span.get()
+    if current is not None:
+        current.update(attrs)
+
+
+def count(**amounts: float) -> None:
+    """
+    Adds to numeric attributes of the current span, e.g. count(retries=1).
+    """
+    current = _current_span.get()
+    if current is not None:
+        for key, amount in amounts.items():
+            current[key] = current.get(key, 0) + amount
+
+
+def count_usage(response) -> None:
+    """
+    Token usage of a chat completion response on the current span.
+    """
+    usage = getattr(response, "usage", None)
+    count(llm_calls=1, prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+          completion_tokens=getattr(usage, "completion_tokens", 0) or 0)
+
+
+def bind(fn: Callable) -> Callable:
+    """
+    Wraps fn to run in (a copy of) the current context, so spans opened on a
+    pool thread belong to the caller's trace and span.
+    """
+    context = contextvars.copy_context()
+
+    def bound(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return bound
+
+
+def _finish(record: Dict[str, Any]) -> None:
+    run = _current_trace.get()
+    if run is not None:
+        record["trace_id"] = run.trace_id
+        run.add(record)
+    _emit(record)
+
+
+def _emit(record: Dict[str, Any]) -> None:
+    if TRACE_LOG:
+        logger.info(json.dumps(record, default=str, ensure_ascii=False))
+
+
+def timing_frame(records: List[Dict[str, Any]]) -> "pd.DataFrame":
+    """
+    Spans as a table for the UI: step (indented by depth), duration and the token columns.
+    """
+    import pandas as pd
+    depth: Dict[str, int] = {}
+    rows = []
+    for r in records:
+        depth[r["span_id"]] = depth.get(r.get("parent_id"), -1) + 1
+        details = {k: v for k, v in r.items()
+                   if k not in ("name", "span_id", "parent_id", "trace_id", "start", "duration_ms", "error")
+                   and k not in TOTAL_KEYS}
+        rows.append({
+            "Schritt": "  " * depth[r["span_id"]] + r["name"],
+            "Dauer (ms)": r["duration_ms"],
+            "LLM-Aufrufe": r.get("llm_calls", 0),
+            "Prompt-Token": r.get("prompt_tokens", 0),
+            "Completion-Token": r.get("completion_tokens", 0),
+            "Retries": r.get("retries", 0),
+            "Details": ", ".join(f"{k}={v}" for k, v in details.items()),
+            "Fehler": r.get("error", ""),
+        })
+    return pd.DataFrame(rows)
@@ -1,39 +1,186 @@
 import pandas as pd
-import pdfplumber
-import io
-from typing import Optional, List, Dict, Any
+import os
+import time
+import concurrent.futures
+from typing import Optional, List, Dict, Any, Iterator
+from modules.storage import content_hash
+from modules.ingest import iter_pages, open_pdf, release_page, spooled_path
+from modules.page_cache import get_page_cache
+from modules.layouts import AUTO_MODE, TableLayout, learn_table_layout
+from modules import tracing
 
-def extract_text_from_pdf(file_stream) -> str:
+# Parallel extraction: worker processes (default: all cores) and the number of
+# uncached pages below which the process pool is not worth its startup cost.
+EXTRACT_WORKERS = int(os.getenv("AUDIT_EXTRACT_WORKERS", "0")) or (os.cpu_count() or 1)
+PARALLEL_MIN_PAGES = int(os.getenv("AUDIT_PARALLEL_MIN_PAGES", "16"))
+# Freshly extracted pages are written to the page cache in batches of this size
+CACHE_WRITE_BATCH = 32
+
+def _extract_page(page, layout: Optional[TableLayout] = None) -> str:
+    if layout is not None:
+        return layout.extract(page)
+    return page.extract_text() or ""
+
+def _extract_page_range(path: str, page_indices: List[int], layout: Optional[TableLayout] = None) -> Dict[int, str]:
+    """
+    Worker: opens the PDF in this process and extracts the given pages.
+    """
+    with open_pdf(path) as pdf:
+        return {idx: _extract_page(page, layout) for idx, page in iter_pages(pdf, page_indices)}
+
+def _split_ranges(page_indices: List[int], parts: int) -> List[List[int]]:
+    size = -(-len(page_indices) // parts)
+    return [page_indices[i:i + size] for i in range(0, len(page_indices), size)]
+
+def iter_page_texts(file_stream, workers: Optional[int] = None, layout: Optional[TableLayout] = None,
+                    table_pattern=None) -> Iterator[str]:
+    """
+    Yields the text of every page in order (empty string for pages without text).
+    Reads through the persistent page cache: only pages that were never seen
+    for this file content are run through pdfplumber. Large documents are split
+    into page ranges that are extracted in a process pool and merged in page order.
+    Pages are produced one at a time, so callers can process arbitrarily long
+    documents without holding all page texts in memory.
+    With a layout only its table region is extracted; with a table_pattern (and
+    no layout) the region is learned from the lines the pattern matches on the
+    first pages (see modules.layouts). Each variant is cached under its own mode.
+    """
+    mode = layout.mode if layout is not None else (AUTO_MODE if table_pattern is not None else "text")
+    stats = {"uncached": 0}
+    pages = _iter_page_texts(file_stream, workers, layout, table_pattern, mode, stats)
+    # Only the time spent producing pages counts, not what the consumer does in between
+    busy, count = 0.0, 0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                text = next(pages)
+            except StopIteration:
+                break
+            finally:
+                busy += time.perf_counter() - started
+            count += 1
+            yield text
+    finally:
+        pages.close()
+        tracing.record("pdf.extract", busy, pages=count, uncached=stats["uncached"], mode=mode)
+
+def _iter_page_texts(file_stream, workers: Optional[int], layout: Optional[TableLayout], table_pattern,
+                     mode: str, stats: Dict[str, int]) -> Iterator[str]:
+    cache = get_page_cache()
+    file_hash = content_hash(file_stream)
+    page_count = cache.get_page_count(file_hash)
+    cached = cache.cached_page_indices(file_hash, mode) if page_count is not None else set()
+    if page_count is not None and len(cached) == page_count:
+        for _, text in cache.iter_pages(file_hash, mode):
+            yield text
+        return
+
+    workers = EXTRACT_WORKERS if workers is None else workers
+    # Uploads are spooled to a temporary file once; pdfplumber and the pool workers read from disk
+    with spooled_path(file_stream) as path:
+        yield from _extract_uncached(path, file_hash, cached, workers, layout, table_pattern, mode, stats)
+
+def _extract_uncached(path: str, file_hash: str, cached: set, workers: int, layout: Optional[TableLayout],
+                      table_pattern, mode: str, stats: Dict[str, int]) -> Iterator[str]:
+    cache = get_page_cache()
+    started = time.perf_counter()
+    with open_pdf(path) as pdf:
+        page_count = len(pdf.pages)
+        tracing.record("pdf.open", time.perf_counter() - started, pages=page_count)
+        cache.set_page_count(file_hash, page_count)
+        missing = [idx for idx in range(page_count) if idx not in cached]
+        stats["uncached"] = len(missing)
+        # Pages already extracted in full while learning the table region
+        learned: Dict[int, str] = {}
+        if layout is None and table_pattern is not None:
+            layout = learn_table_layout(pdf, table_pattern, texts=learned)
+            learned = {idx: text for idx, text in learned.items() if idx not in cached}
+            missing = [idx for idx in missing if idx not in learned]
+        if workers <= 1 or len(missing) < PARALLEL_MIN_PAGES:
+            pending = {}
+            try:
+                for idx in range(page_count):
+                    if idx in learned:
+                        pending[idx] = learned[idx]
+                        yield learned[idx]
+                        continue
+                    text = cache.get_page(file_hash, idx, mode) if idx in cached else None
+                    if text is not None:
+                        yield text
+                        continue
+                    # Not cached (or evicted in the meantime); the page is released right after extraction
+                    page = pdf.pages[idx]
+                    text = _extract_page(page, layout)
+                    release_page(pdf, page)
+                    pending[idx] = text
+                    if len(pending) >= CACHE_WRITE_BATCH:
+                        cache.put_pages(file_hash, pending, mode)
+                        pending = {}
+                    yield text
+            finally:
+                # Also runs when the consumer stops early
+                cache.put_pages(file_hash, pending, mode)
+            return
+
+        cache.put_pages(file_hash, learned, mode)
+        # Two ranges per worker evens out pages of different complexity
+        ranges = _split_ranges(missing, min(len(missing), workers * 2))
+        next_idx = 0
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+            # map() returns the ranges in submission order, i.e. in page order
+            for part in executor.map(_extract_page_range, [path] * len(ranges), ranges, [layout] * len(ranges)):
+                cache.put_pages(file_hash, part, mode)
+                for idx in sorted(part):
+                    for cached_idx in range(next_idx, idx):
+                        yield (learned[cached_idx] if cached_idx in learned
+                               else _cached_or_extract(pdf, file_hash, cached_idx, mode, layout))
+                    yield part[idx]
+                    next_idx = idx + 1
+        for cached_idx in range(next_idx, page_count):
+            yield (learned[cached_idx] if cached_idx in learned
+                   else _cached_or_extract(pdf, file_hash, cached_idx, mode, layout))
+
+def _cached_or_extract(pdf, file_hash: str, idx: int, mode: str, layout: Optional[TableLayout]) -> str:
+    """
+    A page counted as cached at the start of the run; extracted again if the
+    pages written since have evicted it.
+    """
+    cache = get_page_cache()
+    text = cache.get_page(file_hash, idx, mode)
+    if text is None:
+        page = pdf.pages[idx]
+        text = _extract_page(page, layout)
+        release_page(pdf, page)
+        cache.put_pages(file_hash, {idx: text}, mode)
+    return text
+
+def extract_page_texts(file_stream, workers: Optional[int] = None) -> List[str]:
+    """
+    Extracts the text of every page (empty string for pages without text).
+    See iter_page_texts for caching and parallel extraction.
+    """
+    return list(iter_page_texts(file_stream, workers=workers))
+
+def extract_text_from_pdf(file_stream, workers: Optional[int] = None) -> str:
     """
     Extracts text from a PDF file stream robustly.
     """
-    text = ""
     try:
-        with pdfplumber.open(file_stream) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+        pages = extract_page_texts(file_stream, workers=workers)
     except Exception as e:
         return f"Error reading PDF: {str(e)}"
-    return text
+    return "".join(page_text + "\n" for page_text in pages if page_text)
 
 def extract_pages_from_pdf(file_stream) -> List[str]:
     """
     Extracts text from a PDF file stream, returning a list of strings (one per page).
     """
-    pages_content = []
     try:
-        with pdfplumber.open(file_stream) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    pages_content.append(page_text)
-                else:
-                    pages_content.append("") # Empty page placeholder
+        # Empty pages are kept as "" placeholders
+        return extract_page_texts(file_stream)
     except Exception as e:
         return []
-    return pages_content
 
 def load_excel_data(file_stream) -> pd.DataFrame:
     """
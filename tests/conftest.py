@@ -0,0 +1,15 @@
+import pytest
+
+from modules import history, page_cache, price_catalog
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """
+    Isolated data directory with fresh stores (line history, page cache, price catalog).
+    """
+    monkeypatch.setenv("AUDIT_DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.setattr(history, "_default_history", None)
+    monkeypatch.setattr(page_cache, "_default_cache", None)
+    monkeypatch.setattr(price_catalog, "_default_catalog", None)
+    return tmp_path
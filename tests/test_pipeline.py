@@ -0,0 +1,23 @@
+import numpy as np
+from fpdf import FPDF
+
+from modules.history import get_line_history
+from modules.pipeline import start_audit
+
+
+def _invoice_without_items(path):
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=10)
+    pdf.cell(0, 5, "Rechnung 4711", ln=1)
+    pdf.cell(0, 5, "Keine Positionen", ln=1)
+    pdf.output(str(path))
+    return str(path)
+
+
+def test_start_audit_invoice_without_items(data_dir):
+    messages = []
+    state = start_audit(_invoice_without_items(data_dir / "leer.pdf"), log=messages.append)
+    assert state.result.empty
+    assert state.result["Status"].dtype == np.uint8
+    assert get_line_history().stats().empty
@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+
+from modules.reconcile import reconcile, status_counts
+
+
+def test_reconcile_empty_invoice_keeps_status_dtype():
+    df = reconcile(pd.DataFrame(), pd.Series({"867130": 9.7}))
+    assert df.empty
+    assert df["Status"].dtype == np.uint8
+    assert status_counts(df) == {"total": 0, "ok": 0, "price": 0, "ls": 0, "delivery": 0, "duplicate": 0, "drift": 0}
+
+
+def test_status_counts_of_parsed_lines():
+    invoice = pd.DataFrame([{"Rechnung LS-Nr": "1", "Artikel-Nr": "867130", "Bezeichnung": "Plum",
+                             "Menge": "10", "Einheit": "Fla", "Preis_Einzel": "9,70", "Preis_Gesamt": "97,00"}])
+    df = reconcile(invoice, pd.Series({"867130": 9.7}))
+    assert status_counts(df)["ok"] == 1